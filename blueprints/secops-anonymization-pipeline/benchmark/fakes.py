@@ -0,0 +1,476 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import datetime
+import io
+import os
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+
+"""Local stand-ins for google.cloud.storage and the SecOps Chronicle client."""
+# Read by install() so that spawned worker processes share the configuration
+GCS_DIR_ENV = "BENCHMARK_GCS_DIR"
+GCS_LATENCY_ENV = "BENCHMARK_GCS_LATENCY"
+DEFAULT_PAGE_SIZE = 1000
+MAX_REQUEST_BYTES = 4194304
+
+
+class NotFound(Exception):
+    """Raised for missing objects, replaced by the google.api_core class."""
+
+
+class _MemoryBackend:
+    """Objects held in a process local dictionary."""
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, bucket, name, data):
+        with self._lock:
+            self._objects[(bucket, name)] = (data, _now())
+
+    def get(self, bucket, name):
+        with self._lock:
+            if (bucket, name) not in self._objects:
+                raise NotFound(f"{bucket}/{name}")
+            return self._objects[(bucket, name)][0]
+
+    def stat(self, bucket, name):
+        with self._lock:
+            data, created = self._objects.get((bucket, name), (None, None))
+        return (len(data), created) if data is not None else None
+
+    def delete(self, bucket, name):
+        with self._lock:
+            if self._objects.pop((bucket, name), None) is None:
+                raise NotFound(f"{bucket}/{name}")
+
+    def names(self, bucket, prefix):
+        with self._lock:
+            return sorted(
+                name
+                for bucket_name, name in self._objects
+                if bucket_name == bucket and name.startswith(prefix)
+            )
+
+    def open_read(self, bucket, name):
+        return io.BytesIO(self.get(bucket, name))
+
+    def open_write(self, bucket, name):
+        return _MemoryWriter(lambda data: self.put(bucket, name, data))
+
+
+class _MemoryWriter(io.BytesIO):
+    def __init__(self, commit):
+        super().__init__()
+        self._commit = commit
+
+    def close(self):
+        if not self.closed:
+            self._commit(self.getvalue())
+        super().close()
+
+
+class _FileBackend:
+    """Objects stored as files of a local directory, shared across processes.
+
+    Writes go to a temporary file renamed on close, so readers never see a
+    partially written object, like with GCS resumable uploads.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, name):
+        return os.path.join(self.root, bucket, *name.split("/"))
+
+    def put(self, bucket, name, data):
+        with self.open_write(bucket, name) as f:
+            f.write(data)
+
+    def get(self, bucket, name):
+        with self.open_read(bucket, name) as f:
+            return f.read()
+
+    def stat(self, bucket, name):
+        try:
+            stat = os.stat(self._path(bucket, name))
+        except FileNotFoundError:
+            return None
+        created = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+        return stat.st_size, created
+
+    def delete(self, bucket, name):
+        try:
+            os.remove(self._path(bucket, name))
+        except FileNotFoundError:
+            raise NotFound(f"{bucket}/{name}")
+
+    def names(self, bucket, prefix):
+        bucket_root = os.path.join(self.root, bucket)
+        names = []
+        for root, _, files in os.walk(bucket_root):
+            folder = os.path.relpath(root, bucket_root).replace(os.sep, "/")
+            for file_name in files:
+                if file_name.endswith(".tmp"):
+                    continue
+                name = file_name if folder == "." else f"{folder}/{file_name}"
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def open_read(self, bucket, name):
+        try:
+            return open(self._path(bucket, name), "rb")
+        except FileNotFoundError:
+            raise NotFound(f"{bucket}/{name}")
+
+    def open_write(self, bucket, name):
+        path = self._path(bucket, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return _FileWriter(path)
+
+
+class _FileWriter(io.FileIO):
+    def __init__(self, path):
+        self._target = path
+        self._temp = f"{path}.{uuid.uuid4().hex}.tmp"
+        super().__init__(self._temp, "wb")
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            os.replace(self._temp, self._target)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class _Storage:
+    """Backend and simulated per request latency of the fake GCS."""
+
+    backend = _MemoryBackend()
+    latency = 0.0
+
+    @classmethod
+    def request(cls):
+        if cls.latency:
+            time.sleep(cls.latency)
+
+
+class Blob:
+    def __init__(self, name, bucket, size=None, time_created=None):
+        self.name = name
+        self.bucket = bucket
+        self.size = size
+        self.time_created = time_created
+
+    def open(self, mode="r", chunk_size=None, content_type=None, **kwargs):
+        _Storage.request()
+        backend = _Storage.backend
+        if "w" in mode:
+            stream = backend.open_write(self.bucket.name, self.name)
+        else:
+            stream = backend.open_read(self.bucket.name, self.name)
+        if "b" in mode:
+            return stream
+        return io.TextIOWrapper(stream, encoding="utf-8")
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        _Storage.request()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        _Storage.backend.put(self.bucket.name, self.name, data)
+
+    def download_as_bytes(self, **kwargs):
+        _Storage.request()
+        return _Storage.backend.get(self.bucket.name, self.name)
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes().decode("utf-8")
+
+    def exists(self, **kwargs):
+        _Storage.request()
+        return _Storage.backend.stat(self.bucket.name, self.name) is not None
+
+    def reload(self, **kwargs):
+        _Storage.request()
+        stat = _Storage.backend.stat(self.bucket.name, self.name)
+        if stat is None:
+            raise NotFound(f"{self.bucket.name}/{self.name}")
+        self.size, self.time_created = stat
+
+    def delete(self, **kwargs):
+        _Storage.request()
+        _Storage.backend.delete(self.bucket.name, self.name)
+
+
+class Bucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name, **kwargs):
+        return Blob(blob_name, self)
+
+    def list_blobs(self, **kwargs):
+        return self.client.list_blobs(self, **kwargs)
+
+    def delete_blob(self, blob_name, **kwargs):
+        self.blob(blob_name).delete()
+
+    def delete_blobs(self, blobs, **kwargs):
+        for blob in blobs:
+            self.delete_blob(getattr(blob, "name", blob))
+
+    def copy_blob(self, blob, destination_bucket, new_name=None, **kwargs):
+        _Storage.request()
+        new_name = new_name or blob.name
+        data = _Storage.backend.get(self.name, blob.name)
+        _Storage.backend.put(destination_bucket.name, new_name, data)
+        return destination_bucket.blob(new_name)
+
+    def rename_blob(self, blob, new_name, **kwargs):
+        new_blob = self.copy_blob(blob, self, new_name)
+        self.delete_blob(blob.name)
+        return new_blob
+
+
+class _BlobIterator:
+    """Paged listing exposing the prefixes once pages are consumed."""
+
+    def __init__(self, bucket, names, delimiter, prefix, page_size):
+        self._bucket = bucket
+        self._names = names
+        self._delimiter = delimiter
+        self._prefix = prefix
+        self._page_size = page_size
+        self.prefixes = set()
+
+    @property
+    def pages(self):
+        for start in range(0, len(self._names), self._page_size):
+            _Storage.request()
+            page = []
+            for name in self._names[start : start + self._page_size]:
+                rest = name[len(self._prefix) :]
+                if self._delimiter and self._delimiter in rest:
+                    folder = rest.split(self._delimiter)[0]
+                    self.prefixes.add(f"{self._prefix}{folder}{self._delimiter}")
+                    continue
+                stat = _Storage.backend.stat(self._bucket.name, name)
+                if stat is not None:
+                    page.append(Blob(name, self._bucket, *stat))
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class Client:
+    def __init__(self, project=None, **kwargs):
+        self.project = project
+
+    def bucket(self, bucket_name, **kwargs):
+        return Bucket(self, bucket_name)
+
+    def list_blobs(
+        self,
+        bucket_or_name,
+        prefix=None,
+        delimiter=None,
+        max_results=None,
+        page_size=None,
+        **kwargs,
+    ):
+        bucket = bucket_or_name
+        if isinstance(bucket, str):
+            bucket = self.bucket(bucket)
+        prefix = prefix or ""
+        names = _Storage.backend.names(bucket.name, prefix)
+        if max_results:
+            names = names[:max_results]
+        return _BlobIterator(
+            bucket, names, delimiter, prefix, page_size or DEFAULT_PAGE_SIZE
+        )
+
+    @contextlib.contextmanager
+    def batch(self, **kwargs):
+        yield self
+
+
+def configure(root=None, latency=0.0):
+    """Selects the fake GCS backend, in memory unless root is set.
+
+    The configuration is also exported to the environment, so that worker
+    processes started with spawn get the same backend when they import the
+    benchmark modules and call install().
+
+    Args:
+        root: Optional directory holding the objects, one folder per bucket.
+        latency: Seconds added to every simulated GCS request.
+    """
+    _Storage.backend = _FileBackend(root) if root else _MemoryBackend()
+    _Storage.latency = float(latency)
+    if root:
+        os.environ[GCS_DIR_ENV] = root
+    else:
+        os.environ.pop(GCS_DIR_ENV, None)
+    os.environ[GCS_LATENCY_ENV] = str(latency)
+
+
+def install():
+    """Registers the fake as google.cloud.storage, configured from the env.
+
+    Must be called before the pipeline modules are imported. The real
+    google.api_core exceptions are used when available, so that the pipeline
+    catches the NotFound errors raised by the fake.
+    """
+    global NotFound
+    configure(os.environ.get(GCS_DIR_ENV), float(os.environ.get(GCS_LATENCY_ENV) or 0))
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        exceptions = _module("google.api_core.exceptions")
+        exceptions.NotFound = NotFound
+        exceptions.TooManyRequests = type("TooManyRequests", (Exception,), {})
+    NotFound = exceptions.NotFound
+    storage = _module("google.cloud.storage")
+    for cls in (Blob, Bucket, Client):
+        setattr(storage, cls.__name__, cls)
+
+
+def _module(name):
+    """Creates (or replaces) a module and the missing parent packages."""
+    parent_name, _, child = name.rpartition(".")
+    parent = sys.modules.get(parent_name) if parent_name else None
+    if parent_name and parent is None:
+        parent = _module(parent_name)
+        parent.__path__ = []
+    module = types.ModuleType(name)
+    sys.modules[name] = module
+    if parent is not None:
+        setattr(parent, child, module)
+    return module
+
+
+class FakeAPIError(Exception):
+    """API error carrying an HTTP status like the SecOps SDK errors."""
+
+    def __init__(self, status, message):
+        super().__init__(f"status_code={status}: {message}")
+        self.response = types.SimpleNamespace(status_code=status)
+
+
+class FakeChronicle:
+    """Stand-in of the SecOps ChronicleClient used by the pipeline actions.
+
+    Ingestion calls take latency seconds (plus up to jitter seconds), are
+    rejected with 413 above max_request_bytes, with 429 above rate_limit
+    calls per second (token bucket with a one second burst) and with 503 for
+    a failure_rate fraction of calls. Exports are written by an optional
+    export_writer callable and report FINISHED_SUCCESS after export_delay
+    seconds.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        rate_limit=0.0,
+        failure_rate=0.0,
+        max_request_bytes=MAX_REQUEST_BYTES,
+        export_delay=0.0,
+        export_writer=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.max_request_bytes = max_request_bytes
+        self.export_delay = export_delay
+        self.export_writer = export_writer
+        self.calls = {}
+        self.ingested = {}
+        self._exports = {}
+        self._tokens = rate_limit
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + value
+
+    def _acquire(self):
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate_limit,
+                self._tokens + (now - self._refilled) * self.rate_limit,
+            )
+            self._refilled = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def ingest_log(self, log_message, log_type, forwarder_id=None, **kwargs):
+        self._count("ingest_log")
+        if not self._acquire():
+            self._count("throttled")
+            raise FakeAPIError(429, "Quota exceeded for ingestion requests.")
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.failure_rate and random.random() < self.failure_rate:
+            self._count("failed")
+            raise FakeAPIError(503, "Service unavailable.")
+        size = sum(len(line) for line in log_message)
+        if size > self.max_request_bytes:
+            self._count("too_large")
+            raise FakeAPIError(413, "Request payload size exceeds the limit.")
+        with self._lock:
+            self.ingested[log_type] = self.ingested.get(log_type, 0) + len(log_message)
+        return {"operation": f"ingest/{uuid.uuid4().hex}"}
+
+    def create_data_export(
+        self, gcs_bucket, start_time, end_time, log_type=None, **kwargs
+    ):
+        self._count("create_data_export")
+        time.sleep(self.latency)
+        export_id = uuid.uuid4().hex
+        if self.export_writer is not None:
+            self.export_writer(gcs_bucket.split("/")[-1], export_id, log_type)
+        with self._lock:
+            self._exports[export_id] = time.monotonic()
+        name = f"projects/benchmark/dataExports/{export_id}"
+        return {"dataExportStatus": {"name": name, "stage": "IN_QUEUE"}}
+
+    def get_data_export(self, data_export_id):
+        self._count("get_data_export")
+        time.sleep(self.latency)
+        with self._lock:
+            created = self._exports.get(data_export_id, 0.0)
+        finished = time.monotonic() - created >= self.export_delay
+        stage = "FINISHED_SUCCESS" if finished else "PROCESSING"
+        return {"dataExportStatus": {"stage": stage}}
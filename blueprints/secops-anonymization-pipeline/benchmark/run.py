@@ -0,0 +1,204 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source")
+)
+
+import fakes  # noqa: E402
+
+# also run by worker processes started with spawn, which re-import this module
+fakes.install()
+
+import synthetic  # noqa: E402
+from google.cloud import storage  # noqa: E402
+from shared import utils  # noqa: E402
+from shared.batching import AdaptiveBatcher  # noqa: E402
+from shared.deidentify import Deidentifier, deidentify_export  # noqa: E402
+from shared.ingestion import IngestionEngine  # noqa: E402
+from shared.metrics import Metrics  # noqa: E402
+
+LOGGER = logging.getLogger("secops")
+"""Offline throughput benchmark of the anonymization pipeline stages."""
+STAGES = ("list", "split", "deidentify", "import")
+EXPORT_BUCKET = "benchmark-export"
+OUTPUT_BUCKET = "benchmark-output"
+TRANSFORMATIONS = {
+    info_type: {"terms": terms}
+    for info_type, terms in synthetic.DICTIONARY_TERMS.items()
+}
+
+
+def _write_export(args, bucket_name=EXPORT_BUCKET, **kwargs):
+    export_id = uuid.uuid4().hex
+    options = {
+        "log_types": args.log_types,
+        "files_per_type": args.files_per_type,
+        "file_bytes": args.file_bytes,
+        "output_compression": args.compression,
+        "seed": args.seed,
+    }
+    options.update(kwargs)
+    stats = synthetic.write_export(bucket_name, export_id, **options)
+    return export_id, stats
+
+
+def bench_list(args, metrics):
+    """Export folder discovery, with a cold and a warm manifest."""
+    for _ in range(args.exports):
+        _write_export(args, files_per_type=1, file_bytes=1024)
+    export_date = date.today().strftime("%Y-%m-%d")
+    with metrics.stage("list"):
+        with metrics.timer("list.cold_latency"):
+            utils.get_secops_export_folders_for_date(EXPORT_BUCKET, export_date)
+        for _ in range(args.repeat):
+            with metrics.timer("list.warm_latency"):
+                found = utils.get_secops_export_folders_for_date(
+                    EXPORT_BUCKET, export_date
+                )
+    metrics.increment("list.exports", len(found))
+    return {"exports": args.exports}
+
+
+def bench_split(args, metrics):
+    """Split of the export shards above the DLP file size limit."""
+    export_id, stats = _write_export(args)
+    with metrics.stage("split"):
+        utils.split_and_rename_csv_to_log_files(
+            EXPORT_BUCKET, export_id, max_workers=args.split_workers, metrics=metrics
+        )
+    return stats
+
+
+def bench_deidentify(args, metrics):
+    """Local de-identification of an export into the output bucket."""
+    export_id, stats = _write_export(args)
+    with metrics.stage("deidentify"):
+        deidentify_export(
+            EXPORT_BUCKET,
+            OUTPUT_BUCKET,
+            export_id,
+            transformations=TRANSFORMATIONS,
+            pseudonymization_key=args.pseudonymization_key,
+            output_compression=args.compression,
+            max_workers=args.deidentify_workers,
+            metrics=metrics,
+        )
+    return stats
+
+
+def bench_import(args, metrics):
+    """Ingestion of an export through the fake Ingestion API."""
+    export_id, stats = _write_export(args)
+    chronicle = fakes.FakeChronicle(
+        latency=args.ingest_latency,
+        jitter=args.ingest_jitter,
+        rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate,
+    )
+    log_files = [
+        (folder.split("-")[0], blob_name)
+        for folder, blob_names in utils.list_log_files_by_folder(
+            EXPORT_BUCKET, export_id
+        ).items()
+        for blob_name in blob_names
+    ]
+    engine = IngestionEngine(
+        chronicle=chronicle,
+        forwarder_id="benchmark",
+        file_workers=args.file_workers,
+        ingest_workers=args.ingest_workers,
+        batcher=AdaptiveBatcher(max_bytes=args.max_batch_bytes),
+        transform=(
+            Deidentifier(TRANSFORMATIONS, args.pseudonymization_key).deidentify
+            if args.transform
+            else None
+        ),
+        metrics=metrics,
+    )
+    bucket = storage.Client().bucket(EXPORT_BUCKET)
+    with metrics.stage("ingest"):
+        engine.run(bucket, log_files)
+    return dict(stats, chronicle_calls=chronicle.calls)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline stages against local fakes."
+    )
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--gcs-dir", help="Fake GCS directory (default: temp dir).")
+    parser.add_argument("--gcs-latency", type=float, default=0.0)
+    parser.add_argument("--exports", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--log-types", nargs="+", default=synthetic.DEFAULT_LOG_TYPES)
+    parser.add_argument("--files-per-type", type=int, default=4)
+    parser.add_argument("--file-bytes", type=int, default=8388608)
+    parser.add_argument("--compression", choices=("gzip", "zstd"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--split-workers", type=int, default=8)
+    parser.add_argument("--deidentify-workers", type=int)
+    parser.add_argument("--pseudonymization-key")
+    parser.add_argument("--file-workers", type=int, default=4)
+    parser.add_argument("--ingest-workers", type=int, default=8)
+    parser.add_argument("--max-batch-bytes", type=int, default=3145728)
+    parser.add_argument("--ingest-latency", type=float, default=0.05)
+    parser.add_argument("--ingest-jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--transform", action="store_true", help="De-identify lines on ingestion."
+    )
+    parser.add_argument("--output", help="File receiving the JSON results.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if os.environ.get("DEBUG") else logging.WARNING,
+        format="[%(levelname)-8s] - %(asctime)s - %(message)s",
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # a directory backend is shared with the de-identification processes
+        fakes.configure(args.gcs_dir or temp_dir, args.gcs_latency)
+        results = {"config": vars(args), "stages": {}}
+        for stage in STAGES:
+            if stage not in args.stages:
+                continue
+            metrics = Metrics(stage)
+            workload = globals()[f"bench_{stage}"](args, metrics)
+            results["stages"][stage] = {
+                "workload": workload,
+                "metrics": metrics.summary(),
+            }
+            print(json.dumps({stage: results["stages"][stage]}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
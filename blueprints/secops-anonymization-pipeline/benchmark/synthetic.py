@@ -0,0 +1,105 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import random
+from datetime import datetime, timezone
+from google.cloud import storage
+from shared import compression
+
+"""Synthetic SecOps exports laid out like the Data Export API output."""
+DEFAULT_LOG_TYPES = ("WINDOWS_DNS", "GCP_CLOUDAUDIT", "OKTA")
+USERS = [f"user{i:04d}" for i in range(2000)]
+DOMAINS = ("example.org", "corp.example", "mail.example.net")
+# Share of records quoting a multi-line field, as found in JSON log payloads
+MULTILINE_RATIO = 0.02
+# Dictionary terms of the default infoTypes which have no pattern
+DICTIONARY_TERMS = {
+    "AGE": ["age=42"],
+    "CREDIT_CARD_TRACK_NUMBER": ["%B4111111111111111^DOE/JOHN^2512"],
+    "DATE_OF_BIRTH": ["1980-02-29"],
+    "ETHNIC_GROUP": ["ethnic_group"],
+    "FIRST_NAME": ["john"],
+    "LAST_NAME": ["doe"],
+    "PASSPORT": ["X1234567"],
+    "PERSON_NAME": USERS,
+    "STREET_ADDRESS": ["1600 Amphitheatre Parkway"],
+    "SWIFT_CODE": ["DEUTDEFF"],
+}
+
+
+def synthetic_record(rng, log_type):
+    """Returns a CSV log record carrying the usual sensitive values."""
+    user = rng.choice(USERS)
+    ip = ".".join(str(rng.randrange(1, 255)) for _ in range(4))
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    message = (
+        f"{timestamp} {log_type} user={user}@{rng.choice(DOMAINS)} src={ip} "
+        f"phone=+1 555-{rng.randrange(100, 999)}-{rng.randrange(1000, 9999)} "
+        f"card=4111 1111 1111 1111 action={rng.choice(('allow', 'deny'))} "
+        f"session={rng.getrandbits(64):016x}"
+    )
+    if rng.random() < MULTILINE_RATIO:
+        return f'"{message}\nstack=""trace line"""\n'
+    return f"{message}\n"
+
+
+def write_export(
+    bucket_name,
+    export_id,
+    log_types=DEFAULT_LOG_TYPES,
+    files_per_type=2,
+    file_bytes=1048576,
+    output_compression=None,
+    seed=0,
+):
+    """Writes a synthetic export of CSV shards to a bucket.
+
+    Shards are written under {export_id}/{log_type}-{timestamp}/, like the
+    folders created by SecOps exports.
+
+    Args:
+        bucket_name: Name of the export bucket.
+        export_id: Folder (export ID) of the export.
+        log_types: Log types of the export, one folder each.
+        files_per_type: Number of CSV shards per log type.
+        file_bytes: Approximate uncompressed size of each shard.
+        output_compression: Optional compression (gzip or zstd) of the shards.
+        seed: Seed of the record generator, for reproducible exports.
+
+    Returns:
+        A dictionary with the number of files, lines and uncompressed bytes.
+    """
+    rng = random.Random(seed)
+    bucket = storage.Client().bucket(bucket_name)
+    folder_suffix = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    stats = {"files": 0, "lines": 0, "bytes": 0}
+    for log_type in log_types:
+        for index in range(files_per_type):
+            name = compression.add_suffix(
+                f"{export_id}/{log_type}-{folder_suffix}/{index:05d}.csv",
+                output_compression,
+            )
+            size = 0
+            with compression.open_writer(
+                bucket.blob(name), output_compression, text=True
+            ) as f:
+                while size < file_bytes:
+                    record = synthetic_record(rng, log_type)
+                    f.write(record)
+                    size += len(record)
+                    stats["lines"] += record.count("\n")
+            stats["files"] += 1
+            stats["bytes"] += size
+    return stats
@@ -152,6 +152,22 @@ module "function" {
     SECOPS_REGION              = var.secops_config.region
     SECOPS_EXPORT_BUCKET       = module.export-bucket.name
     LOG_EXECUTION_ID           = "true"
+    INGEST_FILE_WORKERS        = var.pipeline_config.ingest.file_workers
+    INGEST_WORKERS             = var.pipeline_config.ingest.workers
+    INGEST_MAX_PENDING_BATCHES = var.pipeline_config.ingest.max_pending_batches
+    INGEST_MAX_BATCH_BYTES     = var.pipeline_config.ingest.max_batch_bytes
+    INGEST_MAX_BATCH_LINES     = var.pipeline_config.ingest.max_batch_lines
+    SPLIT_WORKERS              = var.pipeline_config.split.workers
+    DLP_WORKERS                = var.pipeline_config.dlp.workers
+    EXPORT_WORKERS             = var.pipeline_config.export.workers
+    EXPORT_RATE                = var.pipeline_config.export.rate
+    LOCAL_DEIDENTIFY_ENABLED   = var.pipeline_config.local_deidentify.enabled
+    LOCAL_DEIDENTIFY_MAX_BYTES = var.pipeline_config.local_deidentify.max_export_bytes
+    LOCAL_DEIDENTIFY_WORKERS   = var.pipeline_config.local_deidentify.workers
+    LOCAL_DEIDENTIFY_CONFIG    = jsonencode(var.pipeline_config.local_deidentify.info_types)
+    OUTPUT_COMPRESSION         = var.pipeline_config.local_deidentify.output_compression
+    PIPELINE_POLL_INTERVAL     = var.pipeline_config.pipeline.poll_interval
+    FUNCTION_TIMEOUT           = var.cloud_function_config.timeout_seconds
     }, var.skip_anonymization ? {} : {
     SECOPS_OUTPUT_BUCKET       = module.anonymized-bucket[0].name
     DLP_DEIDENTIFY_TEMPLATE_ID = local.dlp_config.deidentify_template_id
@@ -168,7 +184,14 @@ module "function" {
       "serviceAccount:${module.scheduler-sa.email}"
     ]
   }
-  secrets = {}
+  secrets = var.pipeline_config.local_deidentify.pseudonymization_key == "" ? {} : {
+    PSEUDONYMIZATION_KEY = {
+      is_volume  = false
+      project_id = module.project.project_id
+      secret     = google_secret_manager_secret.pseudonymization_key[0].secret_id
+      versions   = [google_secret_manager_secret_version.pseudonymization_key[0].version]
+    }
+  }
   vpc_connector = (
     var.cloud_function_config.vpc_connector == null
     ? {}
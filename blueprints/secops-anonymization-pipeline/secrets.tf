@@ -0,0 +1,45 @@
+/**
+ * Copyright 2025 Google LLC
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *      http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+# the pseudonymization key is only exposed to the function through Secret
+# Manager, so that it is not readable from the function configuration
+
+resource "google_secret_manager_secret" "pseudonymization_key" {
+  count     = var.pipeline_config.local_deidentify.pseudonymization_key == "" ? 0 : 1
+  project   = module.project.project_id
+  secret_id = "secops-pseudonymization-key"
+  replication {
+    user_managed {
+      replicas {
+        location = var.regions.primary
+      }
+    }
+  }
+}
+
+resource "google_secret_manager_secret_version" "pseudonymization_key" {
+  count       = var.pipeline_config.local_deidentify.pseudonymization_key == "" ? 0 : 1
+  secret      = google_secret_manager_secret.pseudonymization_key[0].id
+  secret_data = var.pipeline_config.local_deidentify.pseudonymization_key
+}
+
+resource "google_secret_manager_secret_iam_member" "pseudonymization_key" {
+  count     = var.pipeline_config.local_deidentify.pseudonymization_key == "" ? 0 : 1
+  project   = module.project.project_id
+  secret_id = google_secret_manager_secret.pseudonymization_key[0].secret_id
+  role      = "roles/secretmanager.secretAccessor"
+  member    = module.function.service_account_iam_email
+}
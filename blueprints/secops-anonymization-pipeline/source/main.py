@@ -13,13 +13,22 @@
 # limitations under the License.
 
 import binascii
+import functools
+import hashlib
 import json
 import os
+import time
 import click
 import logging
 import google.cloud.logging
 from jinja2 import Template
 from shared import utils
+from shared.batching import AdaptiveBatcher
+from shared.checkpoint import Checkpoint, get_state_store
+from shared.deidentify import Deidentifier, deidentify_export
+from shared.ingestion import IngestionEngine
+from shared.metrics import instrumented
+from shared.throttling import RateLimiter, call_with_backoff, run_concurrently
 from google.cloud import dlp_v2
 from google.cloud import storage
 from datetime import date, datetime
@@ -52,88 +61,173 @@ SKIP_ANONYMIZATION = (
 DLP_DEIDENTIFY_TEMPLATE_ID = os.environ.get("DLP_DEIDENTIFY_TEMPLATE_ID")
 DLP_INSPECT_TEMPLATE_ID = os.environ.get("DLP_INSPECT_TEMPLATE_ID")
 DLP_REGION = os.environ.get("DLP_REGION")
+INGEST_FILE_WORKERS = int(os.environ.get("INGEST_FILE_WORKERS", 4))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 8))
+INGEST_MAX_PENDING_BATCHES = int(os.environ.get("INGEST_MAX_PENDING_BATCHES", 16))
+INGEST_MAX_BATCH_BYTES = int(os.environ.get("INGEST_MAX_BATCH_BYTES", 3145728))
+INGEST_MAX_BATCH_LINES = int(os.environ.get("INGEST_MAX_BATCH_LINES", 5000))
+SPLIT_WORKERS = int(os.environ.get("SPLIT_WORKERS", 8))
+DLP_WORKERS = int(os.environ.get("DLP_WORKERS", 8))
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR")
+FUNCTION_TIMEOUT = int(os.environ.get("FUNCTION_TIMEOUT", 3600))
+LOCAL_DEIDENTIFY_ENABLED = (
+    os.environ.get("LOCAL_DEIDENTIFY_ENABLED", "false").lower() == "true"
+)
+LOCAL_DEIDENTIFY_MAX_BYTES = int(os.environ.get("LOCAL_DEIDENTIFY_MAX_BYTES", 0))
+LOCAL_DEIDENTIFY_WORKERS = int(os.environ.get("LOCAL_DEIDENTIFY_WORKERS", 0)) or None
+LOCAL_DEIDENTIFY_CONFIG = json.loads(os.environ.get("LOCAL_DEIDENTIFY_CONFIG") or "{}")
+PSEUDONYMIZATION_KEY = os.environ.get("PSEUDONYMIZATION_KEY")
+OUTPUT_COMPRESSION = os.environ.get("OUTPUT_COMPRESSION") or None
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 3))
+EXPORT_RATE = float(os.environ.get("EXPORT_RATE", 1))
+PIPELINE_POLL_INTERVAL = int(os.environ.get("PIPELINE_POLL_INTERVAL", 60))
+PIPELINE_STATE_KEY = "pipeline/{}/exports.json"  # formatted with the request hash
+PIPELINE_CHECKPOINT_KEY = "pipeline/{}/import.json"
+METRICS_FILE = os.environ.get("METRICS_FILE")
+DEADLINE_MARGIN = 120  # Seconds reserved to persist checkpoints before timeout
+DLP_JOB_STATES_FAILED = (
+    dlp_v2.DlpJob.JobState.FAILED,
+    dlp_v2.DlpJob.JobState.CANCELED,
+)
 
 
-def import_logs(export_date):
-    client = SecOpsClient()
-    chronicle = client.chronicle(
-        customer_id=SECOPS_TARGET_CUSTOMER_ID,
-        project_id=SECOPS_TARGET_PROJECT,
-        region=SECOPS_REGION,
+@functools.cache
+def get_chronicle(customer_id, project_id):
+    """
+    Build the SecOps client of a tenant once per function instance.
+    :param customer_id: SecOps customer ID
+    :param project_id: SecOps GCP project ID
+    :return: ChronicleClient
+    """
+    return SecOpsClient().chronicle(
+        customer_id=customer_id, project_id=project_id, region=SECOPS_REGION
     )
 
+
+@functools.cache
+def get_local_deidentifier():
+    """
+    Build the in-process de-identifier once per function instance, checking
+    that all the configured infoTypes can be detected.
+    :return: Deidentifier, None if local de-identification is not enabled
+    """
+    if not LOCAL_DEIDENTIFY_ENABLED:
+        return None
+    try:
+        return Deidentifier(LOCAL_DEIDENTIFY_CONFIG, PSEUDONYMIZATION_KEY)
+    except ValueError as e:
+        raise SystemExit(f"Invalid local de-identification configuration: {e}")
+
+
+def fits_local_deidentify(export_bytes):
+    """
+    Size rule shared by ANONYMIZE-DATA and PIPELINE: exports are de-identified
+    in process up to LOCAL_DEIDENTIFY_MAX_BYTES, whatever their size when 0.
+    :param export_bytes: size (or estimated volume) of an export
+    :return: whether the export can be de-identified in process
+    """
+    return not LOCAL_DEIDENTIFY_MAX_BYTES or export_bytes <= LOCAL_DEIDENTIFY_MAX_BYTES
+
+
+@instrumented("IMPORT-DATA", METRICS_FILE)
+def import_logs(export_date, metrics=None):
+    chronicle = get_chronicle(SECOPS_TARGET_CUSTOMER_ID, SECOPS_TARGET_PROJECT)
+
     storage_client = storage.Client()
     BUCKET = SECOPS_OUTPUT_BUCKET if not SKIP_ANONYMIZATION else SECOPS_EXPORT_BUCKET
     bucket = storage_client.bucket(BUCKET)
-    export_ids = utils.get_secops_export_folders_for_date(BUCKET, export_date)
+    state_store = get_state_store(BUCKET, CHECKPOINT_DIR)
+    with metrics.stage("list"), metrics.timer("list.latency"):
+        export_ids = utils.get_secops_export_folders_for_date(
+            BUCKET, export_date, state_store=state_store
+        )
 
+    engine = IngestionEngine(
+        chronicle=chronicle,
+        forwarder_id=SECOPS_TARGET_FORWARDER_ID,
+        file_workers=INGEST_FILE_WORKERS,
+        ingest_workers=INGEST_WORKERS,
+        max_pending_batches=INGEST_MAX_PENDING_BATCHES,
+        batcher=AdaptiveBatcher(
+            max_bytes=INGEST_MAX_BATCH_BYTES, max_lines=INGEST_MAX_BATCH_LINES
+        ),
+        metrics=metrics,
+    )
+
+    deadline = time.monotonic() + FUNCTION_TIMEOUT - DEADLINE_MARGIN
+    export_states = utils.get_export_states(BUCKET, state_store=state_store)
     for export_id in export_ids:
-        for folder in utils.list_anonymized_folders(BUCKET, export_id):
-            log_type = folder.split("-")[0]
-
-            for log_file in utils.list_log_files(BUCKET, f"{export_id}/{folder}"):
-                try:
-                    blob = bucket.blob(log_file)  # Directly get the blob object
-                    with blob.open("r") as f:
-                        logs = []
-                        for line in f:
-                            logs.append(line.rstrip("\n"))
-                            if len(logs) == 1000:
-                                response = chronicle.ingest_log(
-                                    log_message=logs,
-                                    log_type=log_type,
-                                    forwarder_id=SECOPS_TARGET_FORWARDER_ID,
-                                )
-                                LOGGER.debug(response)
-                                logs = []
-
-                        # Send any remaining entries
-                        if len(logs) > 0:
-                            response = chronicle.ingest_log(
-                                log_message=logs,
-                                log_type=log_type,
-                                forwarder_id=SECOPS_TARGET_FORWARDER_ID,
-                            )
-                            LOGGER.debug(response)
-                except Exception as e:
-                    LOGGER.error(f"Error during log ingestion': {e}")
-                    raise SystemExit(f"Error during log ingestion: {e}")
+        checkpoint = Checkpoint(state_store, f"{export_id}/import.json")
+        if export_states.get(export_id) != utils.EXPORT_STATE_IMPORTED:
+            log_files = []
+            with metrics.stage("list"), metrics.timer("list.latency"):
+                folders = utils.list_log_files_by_folder(BUCKET, export_id)
+            for folder, files in folders.items():
+                log_type = folder.split("-")[0]
+                for log_file in files:
+                    log_files.append((log_type, log_file))
+
+            try:
+                with metrics.stage("ingest"):
+                    stats = engine.run(
+                        bucket, log_files, checkpoint=checkpoint, deadline=deadline
+                    )
+            except Exception as e:
+                LOGGER.error(f"Error during log ingestion': {e}")
+                raise SystemExit(f"Error during log ingestion: {e}")
+            if not stats["completed"]:
+                raise SystemExit(
+                    f"Timeout while importing export {export_id}, please run "
+                    "IMPORT-DATA again to resume."
+                )
+
+            utils.update_export_state(
+                BUCKET, export_id, utils.EXPORT_STATE_IMPORTED, state_store=state_store
+            )
 
         # delete both export and anonymized buckets after ingesting logs
-        utils.delete_folder(BUCKET, export_id)
-        if not SKIP_ANONYMIZATION:
-            utils.delete_folder(SECOPS_EXPORT_BUCKET, export_id)
+        with metrics.stage("delete"):
+            deleted, failed = utils.delete_folder(BUCKET, export_id)
+            if not SKIP_ANONYMIZATION:
+                export_deleted, export_failed = utils.delete_folder(
+                    SECOPS_EXPORT_BUCKET, export_id
+                )
+                deleted += export_deleted
+                failed += export_failed
+        metrics.increment("delete.objects", deleted)
+        metrics.increment("delete.failed", len(failed))
+        if failed:
+            raise SystemExit(
+                f"Failed to delete {len(failed)} files of export {export_id}, "
+                "please run IMPORT-DATA again."
+            )
+        checkpoint.clear()
 
     LOGGER.info("Finished importing data.")
 
 
+@instrumented("TRIGGER-EXPORT", METRICS_FILE)
 def trigger_export(
     export_date: str,
     export_start_datetime: str,
     export_end_datetime: str,
     log_types: str,
+    export_ids=None,
+    metrics=None,
 ):
     """
     Trigger secops export using Data Export API for a specific date
-    :param secops_source_sa_key_secret_path:
-    :param secops_export_bucket:
-    :param secops_target_project_id:
-    :param log_types:
+    :param log_types: comma separated log types, all logs are exported if empty
     :param export_end_datetime:
     :param export_start_datetime:
-    :param export_date:
-    :param date: datetime (as string) with DD-MM-YYYY format
-    :return:
+    :param export_date: date (as string) with YYYY-MM-DD format
+    :param export_ids: optional dictionary filled with the triggered export
+    IDs, so that callers know them even when other exports fail
+    :return: dictionary mapping each log type (ALL for a full export) to its
+    export ID
     """
 
-    client = SecOpsClient()
-    chronicle = client.chronicle(
-        customer_id=SECOPS_SOURCE_CUSTOMER_ID,
-        project_id=SECOPS_SOURCE_PROJECT,
-        region=SECOPS_REGION,
-    )
-
-    export_ids = []
+    chronicle = get_chronicle(SECOPS_SOURCE_CUSTOMER_ID, SECOPS_SOURCE_PROJECT)
 
     if export_start_datetime and export_end_datetime:
         start_time, end_time = (
@@ -143,57 +237,88 @@ def trigger_export(
     else:
         start_time, end_time = utils.format_date_time_range(date_input=export_date)
     gcs_bucket = f"projects/{GCP_PROJECT_ID}/buckets/{SECOPS_EXPORT_BUCKET}"
+    rate_limiter = RateLimiter(EXPORT_RATE)
 
-    try:
-        if log_types is None or log_types == "":
-            export_response = chronicle.create_data_export(
+    def create_export(log_type):
+        kwargs = (
+            {"export_all_logs": True} if log_type == "ALL" else {"log_type": log_type}
+        )
+        export_response = call_with_backoff(
+            lambda: chronicle.create_data_export(
                 start_time=start_time,
                 end_time=end_time,
                 gcs_bucket=gcs_bucket,
-                export_all_logs=True,
-            )
-            LOGGER.info(export_response)
-            export_id = export_response["dataExportStatus"]["name"].split("/")[-1]
-            export_ids.append(export_id)
-            LOGGER.info(f"Triggered export with ID: {export_id}")
-        else:
-            for log_type in log_types.split(","):
-                export_response = chronicle.create_data_export(
-                    start_time=start_time,
-                    end_time=end_time,
-                    gcs_bucket=gcs_bucket,
-                    log_type=log_type,
-                )
-                export_id = export_response["dataExportStatus"]["name"].split("/")[-1]
-                export_ids.append(export_id)
-                LOGGER.info(f"Triggered export with ID: {export_id}")
-    except Exception as e:
-        LOGGER.error(f"Error during export': {e}")
-        raise SystemExit(f"Error during secops export: {e}")
+                **kwargs,
+            ),
+            rate_limiter=rate_limiter,
+            metrics=metrics,
+            name="export",
+        )
+        LOGGER.debug(export_response)
+        return export_response["dataExportStatus"]["name"].split("/")[-1]
+
+    if log_types is None or log_types == "":
+        requested = ["ALL"]
+    else:
+        requested = [t.strip() for t in log_types.split(",") if t.strip()]
+
+    export_ids = {} if export_ids is None else export_ids
+    with metrics.stage("export"):
+        triggered, failed = run_concurrently(create_export, requested, EXPORT_WORKERS)
+    for log_type, e in failed.items():
+        LOGGER.error(f"Error during {log_type} export': {e}")
+    for log_type, export_id in triggered.items():
+        LOGGER.info(f"Triggered {log_type} export with ID: {export_id}")
+    export_ids.update(triggered)
+    metrics.increment("export.triggered", len(export_ids))
+
+    if failed:
+        raise SystemExit(
+            f"Error during secops export of log types {', '.join(sorted(failed))}, "
+            f"triggered exports: {export_ids}"
+        )
 
     return export_ids
 
 
-def anonymize_data(export_date):
+@instrumented("ANONYMIZE-DATA", METRICS_FILE)
+def anonymize_data(export_date, metrics=None):
     """
     Trigger DLP Job and setup secops feeds to ingest data from output bucket.
     :param export_date: date for which data should be anonymized
     :return:
     """
 
-    client = SecOpsClient()
-    chronicle = client.chronicle(
-        customer_id=SECOPS_SOURCE_CUSTOMER_ID,
-        project_id=SECOPS_SOURCE_PROJECT,
-        region=SECOPS_REGION,
-    )
-    export_ids = utils.get_secops_export_folders_for_date(
-        SECOPS_EXPORT_BUCKET, export_date=export_date
+    deadline = time.monotonic() + FUNCTION_TIMEOUT - DEADLINE_MARGIN
+    local_deidentify = get_local_deidentifier() is not None
+    chronicle = get_chronicle(SECOPS_SOURCE_CUSTOMER_ID, SECOPS_SOURCE_PROJECT)
+    state_store = get_state_store(SECOPS_EXPORT_BUCKET, CHECKPOINT_DIR)
+    with metrics.stage("list"), metrics.timer("list.latency"):
+        export_ids = utils.get_secops_export_folders_for_date(
+            SECOPS_EXPORT_BUCKET, export_date=export_date, state_store=state_store
+        )
+    export_states = utils.get_export_states(
+        SECOPS_EXPORT_BUCKET, state_store=state_store
     )
-
+    export_ids = [
+        export_id
+        for export_id in export_ids
+        if export_states.get(export_id) != utils.EXPORT_STATE_ANONYMIZED
+    ]
+
+    def get_export(export_id):
+        with metrics.timer("export_status.latency"):
+            return chronicle.get_data_export(data_export_id=export_id)
+
+    exports, failed = run_concurrently(get_export, export_ids, DLP_WORKERS)
+    if failed:
+        raise SystemExit(
+            f"Error getting the status of exports {', '.join(sorted(failed))}: "
+            f"{next(iter(failed.values()))}"
+        )
     export_finished = True
     for export_id in export_ids:
-        export = chronicle.get_data_export(data_export_id=export_id)
+        export = exports[export_id]
         LOGGER.info(f"Export response: {export}.")
         if (
             "dataExportStatus" in export
@@ -203,49 +328,347 @@ def anonymize_data(export_date):
             LOGGER.info(f"Export status: {export_state}.")
         else:
             export_finished = False
-            break
 
-    if export_finished:
-        for export_id in export_ids:
-            utils.split_and_rename_csv_to_log_files(SECOPS_EXPORT_BUCKET, export_id)
-
-            with open("dlp_job_template.json.tpl", "r") as template_file:
-                content = template_file.read()
-                template = Template(content)
-                rendered_str = template.render(
-                    {
-                        "export_bucket": SECOPS_EXPORT_BUCKET,
-                        "output_bucket": SECOPS_OUTPUT_BUCKET,
-                        "deidentify_template_id": DLP_DEIDENTIFY_TEMPLATE_ID,
-                        "inspect_template_id": DLP_INSPECT_TEMPLATE_ID,
-                        "export_id": export_id,
-                    }
-                )
-                LOGGER.info(f"Filled template: {rendered_str}")
-                dlp_job = json.loads(rendered_str)
-                LOGGER.info(dlp_job)
-
-                job_request = {
-                    "parent": f"projects/{GCP_PROJECT_ID}/locations/{DLP_REGION}",
-                    "inspect_job": dlp_job,
-                }
-
-                try:
-                    dlp_client = dlp_v2.DlpServiceClient(
-                        client_options={"quota_project_id": GCP_PROJECT_ID}
+    if not export_finished:
+        LOGGER.error("Export is not finished yet, please try again later.")
+        return
+
+    errors = []
+    split = []
+    anonymized = []
+    for export_id in export_ids:
+        if local_deidentify and fits_local_deidentify(
+            utils.get_export_size(SECOPS_EXPORT_BUCKET, export_id)
+        ):
+            try:
+                with metrics.stage("deidentify"):
+                    completed = deidentify_export(
+                        SECOPS_EXPORT_BUCKET,
+                        SECOPS_OUTPUT_BUCKET,
+                        export_id,
+                        transformations=LOCAL_DEIDENTIFY_CONFIG,
+                        pseudonymization_key=PSEUDONYMIZATION_KEY,
+                        output_compression=OUTPUT_COMPRESSION,
+                        max_workers=LOCAL_DEIDENTIFY_WORKERS,
+                        checkpoint=Checkpoint(
+                            state_store, f"{export_id}/deidentify.json"
+                        ),
+                        deadline=deadline,
+                        metrics=metrics,
                     )
-                    response = dlp_client.create_dlp_job(request=job_request)
-                    LOGGER.info(response)
-                except Exception as e:
-                    LOGGER.error(f"Error during export': {e}")
-                    raise SystemExit(f"Error during secops export: {e}")
+            except Exception as e:
+                LOGGER.error(f"Error while de-identifying export {export_id}: {e}")
+                errors.append(e)
+                break
+            if not completed:
+                LOGGER.error(f"Timeout while de-identifying export {export_id}.")
+                break
+            utils.update_export_state(
+                SECOPS_EXPORT_BUCKET,
+                export_id,
+                utils.EXPORT_STATE_ANONYMIZED,
+                state_store=state_store,
+            )
+            anonymized.append(export_id)
+            continue
+        try:
+            with metrics.stage("split"):
+                completed = utils.split_and_rename_csv_to_log_files(
+                    SECOPS_EXPORT_BUCKET,
+                    export_id,
+                    max_workers=SPLIT_WORKERS,
+                    deadline=deadline,
+                    metrics=metrics,
+                )
+        except Exception as e:
+            LOGGER.error(f"Error while splitting export {export_id}: {e}")
+            errors.append(e)
+            break
+        if not completed:
+            LOGGER.error(f"Timeout while splitting export {export_id}.")
+            break
+        split.append(export_id)
 
-    else:
-        LOGGER.error("Export is not finished yet, please try again later.")
+    dlp_jobs, failed = run_concurrently(
+        lambda export_id: create_dlp_job(export_id, metrics), split, DLP_WORKERS
+    )
+    for export_id in split:
+        if export_id in failed:
+            LOGGER.error(f"Error during export {export_id}: {failed[export_id]}")
+            errors.append(failed[export_id])
+            continue
+        LOGGER.info(dlp_jobs[export_id])
+        utils.update_export_state(
+            SECOPS_EXPORT_BUCKET,
+            export_id,
+            utils.EXPORT_STATE_ANONYMIZED,
+            state_store=state_store,
+        )
+
+    if errors:
+        raise SystemExit(f"Error during secops export: {errors[0]}")
+    if len(split) + len(anonymized) < len(export_ids):
+        raise SystemExit(
+            "Timeout while processing exports, please run ANONYMIZE-DATA again "
+            "to resume."
+        )
 
     LOGGER.info("Triggered all DLP jobs successfully.")
 
 
+@functools.cache
+def get_dlp_job_template():
+    """
+    Load and compile the DLP job template once per function instance.
+    :return: compiled Jinja2 template
+    """
+    with open("dlp_job_template.json.tpl", "r") as template_file:
+        return Template(template_file.read())
+
+
+@functools.cache
+def get_dlp_client():
+    """
+    Build the DLP client once per function instance.
+    :return: DLP service client
+    """
+    return dlp_v2.DlpServiceClient(client_options={"quota_project_id": GCP_PROJECT_ID})
+
+
+def create_dlp_job(export_id, metrics):
+    """
+    Create the DLP job anonymizing the files of an export.
+    :param export_id: ID of the export to anonymize
+    :param metrics: Metrics recording the DLP API latency
+    :return: DLP job creation response
+    """
+    rendered_str = get_dlp_job_template().render(
+        {
+            "export_bucket": SECOPS_EXPORT_BUCKET,
+            "output_bucket": SECOPS_OUTPUT_BUCKET,
+            "deidentify_template_id": DLP_DEIDENTIFY_TEMPLATE_ID,
+            "inspect_template_id": DLP_INSPECT_TEMPLATE_ID,
+            "export_id": export_id,
+        }
+    )
+    LOGGER.info(f"Filled template: {rendered_str}")
+    dlp_job = json.loads(rendered_str)
+
+    job_request = {
+        "parent": f"projects/{GCP_PROJECT_ID}/locations/{DLP_REGION}",
+        "inspect_job": dlp_job,
+    }
+    with metrics.timer("dlp.latency"):
+        dlp_job = get_dlp_client().create_dlp_job(request=job_request)
+    metrics.increment("dlp.jobs")
+    return dlp_job
+
+
+def anonymize_pipeline_exports(
+    export_ids, shards, state, state_key, state_store, deadline, metrics
+):
+    """
+    Anonymize the exports of a pipeline with DLP jobs, as ANONYMIZE-DATA does.
+    Exports are split and their DLP jobs created once they are finished, DLP
+    jobs are persisted in the pipeline state so that a run interrupted by the
+    function timeout resumes waiting for them.
+    :param export_ids: IDs of the exports of the pipeline
+    :param shards: shards of the exports, consumed until they are finished
+    :param state: pipeline state
+    :param state_key: key of the pipeline state in the state store
+    :param state_store: store of the pipeline state and checkpoints
+    :param deadline: time.monotonic() value after which the run is stopped
+    :param metrics: Metrics of the pipeline
+    :return: log type and name of the anonymized files in the output bucket
+    """
+    dlp_jobs = state.setdefault("dlp_jobs", {})
+    if len(dlp_jobs) < len(export_ids):
+        try:
+            with metrics.stage("export"):
+                for _ in shards:
+                    pass
+        except TimeoutError as e:
+            raise SystemExit(f"{e} Please run PIPELINE again to resume.")
+        except RuntimeError as e:
+            raise SystemExit(f"Error during pipeline: {e}")
+
+    for export_id in export_ids:
+        if export_id in dlp_jobs:
+            continue
+        with metrics.stage("split"):
+            completed = utils.split_and_rename_csv_to_log_files(
+                SECOPS_EXPORT_BUCKET,
+                export_id,
+                max_workers=SPLIT_WORKERS,
+                deadline=deadline,
+                metrics=metrics,
+            )
+        if not completed:
+            raise SystemExit(
+                "Timeout while splitting exports, please run PIPELINE again to resume."
+            )
+        dlp_jobs[export_id] = create_dlp_job(export_id, metrics).name
+        state_store.save(state_key, state)
+
+    pending = set(dlp_jobs.values())
+    with metrics.stage("dlp"):
+        while pending:
+            for name in sorted(pending):
+                with metrics.timer("dlp.latency"):
+                    job = get_dlp_client().get_dlp_job(request={"name": name})
+                if job.state == dlp_v2.DlpJob.JobState.DONE:
+                    pending.discard(name)
+                elif job.state in DLP_JOB_STATES_FAILED:
+                    raise SystemExit(f"DLP job {name} ended with state {job.state}.")
+            if not pending:
+                break
+            if time.monotonic() + PIPELINE_POLL_INTERVAL > deadline:
+                raise SystemExit(
+                    "Timeout while waiting for DLP jobs, please run PIPELINE again "
+                    "to resume."
+                )
+            time.sleep(PIPELINE_POLL_INTERVAL)
+
+    log_files = []
+    for export_id in export_ids:
+        folders = utils.list_log_files_by_folder(SECOPS_OUTPUT_BUCKET, export_id)
+        for folder, files in folders.items():
+            log_files += [(folder.split("-")[0], log_file) for log_file in files]
+    return log_files
+
+
+@instrumented("PIPELINE", METRICS_FILE)
+def run_pipeline(
+    export_date: str,
+    export_start_datetime: str,
+    export_end_datetime: str,
+    log_types: str,
+    metrics=None,
+):
+    """
+    Stream the shards of new exports through de-identification and ingestion.
+    With local de-identification enabled (or anonymization skipped) shards
+    are ingested as soon as they land in the export bucket, without splitting
+    them nor writing anonymized copies, otherwise exports are anonymized by
+    DLP jobs before being ingested. Triggered exports are persisted under a
+    hash of the request, even when some of them failed, so that a run
+    interrupted by an error or the function timeout is resumed by triggering
+    PIPELINE again with the same parameters, without re-triggering exports.
+    :param export_date: date (as string) with YYYY-MM-DD format
+    :param export_start_datetime:
+    :param export_end_datetime:
+    :param log_types: comma separated log types, all logs are exported if empty
+    :return:
+    """
+    deadline = time.monotonic() + FUNCTION_TIMEOUT - DEADLINE_MARGIN
+    local_deidentifier = None if SKIP_ANONYMIZATION else get_local_deidentifier()
+    state_store = get_state_store(SECOPS_EXPORT_BUCKET, CHECKPOINT_DIR)
+    request = {
+        "export_date": export_date,
+        "export_start_datetime": export_start_datetime,
+        "export_end_datetime": export_end_datetime,
+        "log_types": log_types or "",
+    }
+    request_hash = hashlib.sha256(
+        json.dumps(request, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    state_key = PIPELINE_STATE_KEY.format(request_hash)
+    state = state_store.load(state_key) or {"request": request, "export_ids": {}}
+    requested = [t.strip() for t in request["log_types"].split(",") if t.strip()]
+    missing = [t for t in requested or ["ALL"] if t not in state["export_ids"]]
+    if state["export_ids"]:
+        LOGGER.info(f"Resuming pipeline of exports {state['export_ids']}.")
+    if missing:
+        try:
+            trigger_export(
+                export_date=export_date,
+                export_start_datetime=export_start_datetime,
+                export_end_datetime=export_end_datetime,
+                log_types="" if missing == ["ALL"] else ",".join(missing),
+                export_ids=state["export_ids"],
+                metrics=metrics,
+            )
+        finally:
+            # exports triggered before a failure are resumed by the next run
+            state_store.save(state_key, state)
+    export_ids = list(state["export_ids"].values())
+
+    source = get_chronicle(SECOPS_SOURCE_CUSTOMER_ID, SECOPS_SOURCE_PROJECT)
+
+    def get_export(export_id):
+        with metrics.timer("export_status.latency"):
+            return source.get_data_export(data_export_id=export_id)
+
+    if local_deidentifier is not None and "local_deidentify" not in state:
+        # decided once, shards may already have been ingested when resuming
+        state["local_deidentify"] = all(
+            fits_local_deidentify(int(get_export(export_id).get("estimatedVolume", 0)))
+            for export_id in export_ids
+        )
+        state_store.save(state_key, state)
+    if not state.get("local_deidentify", True):
+        LOGGER.info("Exports too large for local de-identification, using DLP.")
+        local_deidentifier = None
+
+    shards = utils.watch_export_shards(
+        SECOPS_EXPORT_BUCKET,
+        export_ids,
+        get_export,
+        poll_interval=PIPELINE_POLL_INTERVAL,
+        deadline=deadline,
+    )
+    bucket_name = SECOPS_EXPORT_BUCKET
+    if not SKIP_ANONYMIZATION and local_deidentifier is None:
+        # without the opt-in local engine, exports are anonymized by DLP
+        shards = anonymize_pipeline_exports(
+            export_ids, shards, state, state_key, state_store, deadline, metrics
+        )
+        bucket_name = SECOPS_OUTPUT_BUCKET
+
+    engine = IngestionEngine(
+        chronicle=get_chronicle(SECOPS_TARGET_CUSTOMER_ID, SECOPS_TARGET_PROJECT),
+        forwarder_id=SECOPS_TARGET_FORWARDER_ID,
+        file_workers=INGEST_FILE_WORKERS,
+        ingest_workers=INGEST_WORKERS,
+        max_pending_batches=INGEST_MAX_PENDING_BATCHES,
+        batcher=AdaptiveBatcher(
+            max_bytes=INGEST_MAX_BATCH_BYTES, max_lines=INGEST_MAX_BATCH_LINES
+        ),
+        transform=local_deidentifier.deidentify if local_deidentifier else None,
+        metrics=metrics,
+    )
+    checkpoint = Checkpoint(state_store, PIPELINE_CHECKPOINT_KEY.format(request_hash))
+    bucket = storage.Client().bucket(bucket_name)
+    try:
+        with metrics.stage("ingest"):
+            stats = engine.run(bucket, shards, checkpoint=checkpoint, deadline=deadline)
+    except TimeoutError as e:
+        raise SystemExit(f"{e} Please run PIPELINE again to resume.")
+    except Exception as e:
+        LOGGER.error(f"Error during pipeline': {e}")
+        raise SystemExit(f"Error during pipeline: {e}")
+    if not stats["completed"]:
+        raise SystemExit(
+            "Timeout while ingesting exports, please run PIPELINE again to resume."
+        )
+
+    failed = []
+    with metrics.stage("delete"):
+        for export_id in export_ids:
+            for folder_bucket in {SECOPS_EXPORT_BUCKET, bucket_name}:
+                deleted, export_failed = utils.delete_folder(folder_bucket, export_id)
+                metrics.increment("delete.objects", deleted)
+                failed += export_failed
+    metrics.increment("delete.failed", len(failed))
+    if failed:
+        raise SystemExit(
+            f"Failed to delete {len(failed)} exported files, please run PIPELINE again."
+        )
+    checkpoint.clear()
+    state_store.delete(state_key)
+    LOGGER.info("Finished pipeline.")
+
+
 def main(request):
     """
     Entry point for Cloud Function triggered by HTTP request.
@@ -279,8 +702,15 @@ def main(request):
             anonymize_data(export_date=export_date)
         case "IMPORT-DATA":
             import_logs(export_date=export_date)
+        case "PIPELINE":
+            run_pipeline(
+                export_date=export_date,
+                export_start_datetime=export_start_datetime,
+                export_end_datetime=export_end_datetime,
+                log_types=log_types,
+            )
         case _:
-            return "Action must be either 'TRIGGER-EXPORT', 'ANONYMIZE-DATA' or 'IMPORT-DATA'"
+            return "Action must be either 'TRIGGER-EXPORT', 'ANONYMIZE-DATA', 'IMPORT-DATA' or 'PIPELINE'"
 
     return "Success."
 
@@ -310,7 +740,7 @@ def main(request):
 @click.option("--log-type", type=str, multiple=True)
 @click.option(
     "--action",
-    type=click.Choice(["TRIGGER-EXPORT", "ANONYMIZE-DATA", "IMPORT-DATA"]),
+    type=click.Choice(["TRIGGER-EXPORT", "ANONYMIZE-DATA", "IMPORT-DATA", "PIPELINE"]),
     required=True,
 )
 @click.option("--debug", is_flag=True, default=False, help="Turn on debug logging.")
@@ -341,8 +771,15 @@ def main_cli(
             anonymize_data(export_date=export_date)
         case "IMPORT-DATA":
             import_logs(export_date=export_date)
+        case "PIPELINE":
+            run_pipeline(
+                export_date=export_date,
+                export_start_datetime=export_start_datetime,
+                export_end_datetime=export_end_datetime,
+                log_types=",".join(log_type),
+            )
         case _:
-            return "Action must be either 'TRIGGER-EXPORT', 'ANONYMIZE-DATA' or 'IMPORT-DATA'"
+            return "Action must be either 'TRIGGER-EXPORT', 'ANONYMIZE-DATA', 'IMPORT-DATA' or 'PIPELINE'"
 
     return "Success."
 
@@ -0,0 +1,125 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import re
+import threading
+
+LOGGER = logging.getLogger("secops")
+"""Byte-size aware batching of log lines for the Ingestion API."""
+DEFAULT_MAX_BATCH_BYTES = 3145728  # Stay below the 4MB import request limit
+DEFAULT_MAX_BATCH_LINES = 5000
+DEFAULT_TARGET_LATENCY = 5.0
+MIN_BATCH_BYTES = 65536
+# Per entry JSON envelope (log_entry_time, collection_time and keys)
+ENTRY_OVERHEAD_BYTES = 96
+_STATUS_RE = re.compile(r"status(?:_code)?=(\d{3})")
+
+
+def entry_size(line):
+    """Returns the approximate request payload size of a log line.
+
+    Log lines are base64 encoded by the Ingestion API client, so the size on
+    the wire is 4/3 of the UTF-8 encoded line plus the JSON entry envelope.
+    """
+    return 4 * ((len(line.encode("utf-8")) + 2) // 3) + ENTRY_OVERHEAD_BYTES
+
+
+def status_code(error):
+    """Extracts the HTTP status code from an Ingestion API error, if any."""
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return int(response.status_code)
+    match = _STATUS_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+class AdaptiveBatcher:
+    """Cuts log lines in batches bounded by payload bytes and line count.
+
+    The byte budget starts at max_bytes and adapts to the responses observed
+    by the ingest workers: it shrinks when calls are slower than the target
+    latency or are rejected as too large (HTTP 413), and grows back when
+    calls are fast or throttled (HTTP 429), since fewer larger requests are
+    the only way to move more data under a request rate quota.
+    """
+
+    def __init__(
+        self,
+        max_bytes=DEFAULT_MAX_BATCH_BYTES,
+        max_lines=DEFAULT_MAX_BATCH_LINES,
+        target_latency=DEFAULT_TARGET_LATENCY,
+    ):
+        """
+        Args:
+            max_bytes: Maximum payload size of a single ingest_log call.
+            max_lines: Maximum number of log lines of a single ingest_log call.
+            target_latency: Ingest latency (seconds) above which batches shrink.
+        """
+        self.max_bytes = max(MIN_BATCH_BYTES, int(max_bytes))
+        self.max_lines = max(1, int(max_lines))
+        self.target_latency = float(target_latency)
+        self._limit = self.max_bytes
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        """Current byte budget of a batch."""
+        with self._lock:
+            return self._limit
+
+    def _resize(self, factor):
+        with self._lock:
+            limit = int(self._limit * factor)
+            self._limit = min(self.max_bytes, max(MIN_BATCH_BYTES, limit))
+            return self._limit
+
+    def batches(self, lines):
+        """Groups lines in batches fitting the current byte budget.
+
+        Args:
+            lines: Iterable of log lines (trailing newlines are stripped).
+
+        Yields:
+            Tuples of (list of log lines, payload size in bytes).
+        """
+        batch, size, limit = [], 0, self.limit
+        for line in lines:
+            line = line.rstrip("\n")
+            line_size = entry_size(line)
+            if batch and (size + line_size > limit or len(batch) >= self.max_lines):
+                yield batch, size
+                batch, size, limit = [], 0, self.limit
+            batch.append(line)
+            size += line_size
+        if batch:
+            yield batch, size
+
+    def record_success(self, latency):
+        """Adapts the byte budget to the latency of a successful call."""
+        if latency > self.target_latency:
+            self._resize(0.75)
+        elif latency < self.target_latency / 2:
+            self._resize(1.1)
+
+    def record_too_large(self):
+        """Halves the byte budget after a request was rejected as too large."""
+        limit = self._resize(0.5)
+        LOGGER.warning(f"Ingestion request too large, batch size set to {limit}B.")
+
+    def record_throttled(self):
+        """Grows the byte budget to reduce the request rate after a 429."""
+        limit = self._resize(1.25)
+        LOGGER.warning(f"Ingestion request throttled, batch size set to {limit}B.")
@@ -0,0 +1,150 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import logging
+import os
+import threading
+from google.cloud import storage
+
+LOGGER = logging.getLogger("secops")
+"""Persisted pipeline state used to resume interrupted actions."""
+# Objects under this prefix hold pipeline state and are never export folders
+PIPELINE_STATE_PREFIX = "_pipeline"
+
+
+class GcsStateStore:
+    """Stores JSON state documents as objects of a GCS bucket."""
+
+    def __init__(self, bucket_name):
+        self.bucket = storage.Client().bucket(bucket_name)
+
+    def _blob(self, key):
+        return self.bucket.blob(f"{PIPELINE_STATE_PREFIX}/{key}")
+
+    def load(self, key):
+        blob = self._blob(key)
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_text())
+
+    def save(self, key, state):
+        self._blob(key).upload_from_string(
+            json.dumps(state), content_type="application/json"
+        )
+
+    def delete(self, key):
+        blob = self._blob(key)
+        if blob.exists():
+            blob.delete()
+
+
+class LocalStateStore:
+    """Stores JSON state documents as files of a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, PIPELINE_STATE_PREFIX, key)
+
+    def load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf8") as f:
+            return json.load(f)
+
+    def save(self, key, state):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf8") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def delete(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def get_state_store(bucket_name, local_dir=None):
+    """Returns a local state store if local_dir is set, a GCS one otherwise.
+
+    Local stores are namespaced by bucket, so that the state documents of
+    different buckets (e.g. their export manifests) stay apart as they do in
+    GCS.
+
+    Args:
+        bucket_name: Bucket holding the state objects.
+        local_dir: Optional local directory used instead of the bucket.
+    """
+    if local_dir:
+        return LocalStateStore(os.path.join(local_dir, bucket_name))
+    return GcsStateStore(bucket_name)
+
+
+class Checkpoint:
+    """Thread-safe record of completed work items and per-item offsets."""
+
+    def __init__(self, store, key):
+        """
+        Args:
+            store: GcsStateStore or LocalStateStore holding the checkpoint.
+            key: Name of the checkpoint document within the store.
+        """
+        self.store = store
+        self.key = key
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        state = store.load(key) or {}
+        self._done = set(state.get("done", []))
+        self._offsets = dict(state.get("offsets", {}))
+        if self._done or self._offsets:
+            LOGGER.info(
+                f"Resuming from checkpoint {key}: {len(self._done)} items done."
+            )
+
+    def is_done(self, item):
+        with self._lock:
+            return item in self._done
+
+    def mark_done(self, item):
+        with self._lock:
+            self._done.add(item)
+            self._offsets.pop(item, None)
+
+    def get_offset(self, item):
+        with self._lock:
+            return self._offsets.get(item, 0)
+
+    def set_offset(self, item, offset):
+        with self._lock:
+            self._offsets[item] = offset
+
+    def flush(self):
+        """Persists the checkpoint."""
+        # serialize flushes so that an older snapshot never overwrites a newer one
+        with self._flush_lock:
+            with self._lock:
+                state = {"done": sorted(self._done), "offsets": dict(self._offsets)}
+            self.store.save(self.key, state)
+
+    def clear(self):
+        """Deletes the persisted checkpoint once all the work is complete."""
+        with self._lock:
+            self._done.clear()
+            self._offsets.clear()
+        self.store.delete(self.key)
@@ -0,0 +1,132 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import gzip
+import io
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOGGER = logging.getLogger("secops")
+"""Transparent streaming (de)compression of GCS objects."""
+STREAM_CHUNK_SIZE = 8388608  # GCS read/upload chunk, multiple of 256KB
+GZIP_COMPRESSION_LEVEL = 6
+ZSTD_COMPRESSION_LEVEL = 3
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _check_codec(compression):
+    if compression not in SUFFIXES:
+        raise ValueError(f"Unsupported compression {compression}.")
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("The zstandard package is required for zstd objects.")
+
+
+def get_compression(blob_name):
+    """Returns the compression (gzip, zstd or None) of an object name."""
+    for compression, suffix in SUFFIXES.items():
+        if blob_name.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_suffix(blob_name):
+    """Returns an object name without its compression suffix."""
+    compression = get_compression(blob_name)
+    return blob_name[: -len(SUFFIXES[compression])] if compression else blob_name
+
+
+def add_suffix(blob_name, compression=None):
+    """Returns an object name with the suffix of a compression (if any)."""
+    if not compression:
+        return blob_name
+    _check_codec(compression)
+    return blob_name + SUFFIXES[compression]
+
+
+def has_extension(blob_name, *extensions):
+    """Returns True if the name ends with one of extensions, compressed or not."""
+    return strip_suffix(blob_name).endswith(extensions)
+
+
+def open_reader(blob, text=False):
+    """Opens a streaming reader of an object, decompressed by its suffix.
+
+    Args:
+        blob: GCS blob to read.
+        text: Whether to return a UTF-8 text stream instead of a binary one.
+    """
+    compression = get_compression(blob.name)
+    raw = blob.open("rb", chunk_size=STREAM_CHUNK_SIZE)
+    if compression == "gzip":
+        stream = _ClosingGzipFile(raw, mode="rb")
+    elif compression == "zstd":
+        _check_codec(compression)
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        stream = io.BufferedReader(stream, buffer_size=io.DEFAULT_BUFFER_SIZE * 16)
+    else:
+        stream = raw
+    if text:
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return stream
+
+
+def open_writer(blob, compression=None, text=False):
+    """Opens a streaming writer of an object, compressed if requested.
+
+    Args:
+        blob: GCS blob to write, its name should carry the compression suffix.
+        compression: Optional compression (gzip or zstd).
+        text: Whether to return a UTF-8 text stream instead of a binary one.
+    """
+    if compression:
+        _check_codec(compression)
+    raw = blob.open("wb", chunk_size=STREAM_CHUNK_SIZE, content_type="text/plain")
+    if compression == "gzip":
+        stream = _ClosingGzipFile(raw, mode="wb")
+    elif compression == "zstd":
+        stream = zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL).stream_writer(
+            raw, closefd=True
+        )
+    else:
+        stream = raw
+    if text:
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return stream
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """GzipFile which also closes its target.
+
+    Closing releases the blob reader, or finalizes the upload of the blob
+    writer.
+    """
+
+    def __init__(self, fileobj, mode):
+        super().__init__(
+            fileobj=fileobj, mode=mode, compresslevel=GZIP_COMPRESSION_LEVEL
+        )
+        self._target = fileobj
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self._target.close()
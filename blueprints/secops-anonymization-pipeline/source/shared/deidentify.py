@@ -0,0 +1,321 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent import futures
+from google.cloud import storage
+from shared import compression
+from shared.metrics import Metrics
+from shared.pseudonymize import Pseudonymizer
+
+LOGGER = logging.getLogger("secops")
+"""In-process de-identification of exported logs, used instead of DLP jobs."""
+CHECKPOINT_INTERVAL = 20  # De-identified blobs between checkpoint flushes
+
+# Patterns of the infoTypes which can be reliably detected without context,
+# other infoTypes need dictionary terms. Only configured infoTypes are matched,
+# and each of them needs either a pattern or dictionary terms.
+INFO_TYPE_PATTERNS = {
+    "EMAIL_ADDRESS": (
+        r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b"
+    ),
+    "CREDIT_CARD_NUMBER": r"(?<![\w-])[3-6]\d{3}(?:[ -]?\d{4}){2}[ -]?\d{3,4}(?![\w-])",
+    "IP_ADDRESS": (
+        r"(?<![\w.])(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}"
+        r"(?:25[0-5]|2[0-4]\d|1?\d?\d)(?!\w|\.\d)"
+    ),
+    "IBAN_CODE": r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b",
+    "PHONE_NUMBER": (
+        r"(?<![\w+])(?:\+\d{1,3}[ -]?)?(?:\(\d{2,4}\)|\d{2,4})[ -]\d{3,4}[ -]\d{3,4}\b"
+    ),
+    "VEHICLE_IDENTIFICATION_NUMBER": (
+        r"\b(?=[A-HJ-NPR-Z0-9]{0,16}\d)(?=[A-HJ-NPR-Z0-9]{0,16}[A-HJ-NPR-Z])"
+        r"[A-HJ-NPR-Z0-9]{17}\b"
+    ),
+}
+
+# Replacement values of the sample de-identify template, plus IP addresses
+TEMPLATE_TRANSFORMATIONS = {
+    "AGE": {"replace": "10"},
+    "CREDIT_CARD_NUMBER": {"replace": "1234567812345678"},
+    "CREDIT_CARD_TRACK_NUMBER": {"replace": "1234567812345678"},
+    "DATE_OF_BIRTH": {"replace": "1990-01-01"},
+    "EMAIL_ADDRESS": {"replace": "john.doe@fakedomain.com"},
+    "ETHNIC_GROUP": {"replace": "None"},
+    "FIRST_NAME": {"replace": "john"},
+    "GENDER": {"replace": "Gender", "terms": ["female", "male", "non-binary"]},
+    "IBAN_CODE": {"replace": "2131312312312312"},
+    "IP_ADDRESS": {"replace": "0.0.0.0"},
+    "LAST_NAME": {"replace": "doe"},
+    "PASSPORT": {"replace": "2131312312312312"},
+    "PERSON_NAME": {"replace": "john"},
+    "PHONE_NUMBER": {"replace": "3333333333"},
+    "STREET_ADDRESS": {"replace": "street address"},
+    "SWIFT_CODE": {"replace": "2131312312312312"},
+    "VEHICLE_IDENTIFICATION_NUMBER": {"replace": "2131312312312312"},
+}
+
+# The template infoTypes detected without configuration, the other ones are
+# de-identified with their template values once dictionary terms are set
+DEFAULT_TRANSFORMATIONS = {
+    info_type: config
+    for info_type, config in TEMPLATE_TRANSFORMATIONS.items()
+    if info_type in INFO_TYPE_PATTERNS or config.get("terms")
+}
+
+
+def luhn_valid(value):
+    """Returns True if the digits of value pass the Luhn checksum."""
+    digits = [int(c) for c in value if c.isdigit()]
+    checksum = sum(digits[-1::-2])
+    checksum += sum(sum(divmod(d * 2, 10)) for d in digits[-2::-2])
+    return checksum % 10 == 0
+
+
+def mask(value):
+    """Format-preserving mask: digits become 0, letters x or X."""
+    return "".join(
+        "0" if c.isdigit() else ("X" if c.isupper() else "x") if c.isalpha() else c
+        for c in value
+    )
+
+
+class Deidentifier:
+    """Replaces sensitive values of log lines with a single regex pass.
+
+    The patterns and dictionary terms of all the configured infoTypes are
+    compiled into a single alternation of named groups, so each line is
+    scanned once regardless of the number of infoTypes.
+    """
+
+    def __init__(self, transformations=None, pseudonymization_key=None):
+        """
+        Args:
+            transformations: Optional dictionary of infoType -> transformation
+                overriding DEFAULT_TRANSFORMATIONS. A transformation contains
+                either a "replace" value, "mask" set to True (format-preserving
+                mask) or "pseudonymize" set to True (keyed-hash token), and an
+                optional list of dictionary "terms". Other template infoTypes
+                default to their TEMPLATE_TRANSFORMATIONS value, and a None or
+                empty transformation removes an infoType.
+            pseudonymization_key: Key of the pseudonymization tokens, required
+                if any transformation is set to pseudonymize.
+
+        Raises:
+            ValueError: If a configured infoType has neither a pattern nor
+                dictionary terms, as its values would be left in clear, or if
+                all the infoTypes were removed.
+        """
+        self.transformations = {
+            info_type: dict(config)
+            for info_type, config in DEFAULT_TRANSFORMATIONS.items()
+        }
+        for info_type, config in (transformations or {}).items():
+            config = {
+                key: value for key, value in (config or {}).items() if value is not None
+            }
+            if not config:
+                self.transformations.pop(info_type, None)
+                continue
+            self.transformations.setdefault(
+                info_type, dict(TEMPLATE_TRANSFORMATIONS.get(info_type, {}))
+            ).update(config)
+        undetected = sorted(
+            info_type
+            for info_type, config in self.transformations.items()
+            if info_type not in INFO_TYPE_PATTERNS and not config.get("terms")
+        )
+        if undetected:
+            raise ValueError(
+                "No pattern nor dictionary terms for infoTypes "
+                f"{', '.join(undetected)}."
+            )
+        if not self.transformations:
+            raise ValueError("No infoType to de-identify.")
+        self.pseudonymizer = None
+        if any(c.get("pseudonymize") for c in self.transformations.values()):
+            self.pseudonymizer = Pseudonymizer(pseudonymization_key)
+        patterns = []
+        for info_type, config in self.transformations.items():
+            alternatives = []
+            if info_type in INFO_TYPE_PATTERNS:
+                alternatives.append(INFO_TYPE_PATTERNS[info_type])
+            terms = sorted(set(config.get("terms") or []), key=len, reverse=True)
+            if terms:
+                words = "|".join(re.escape(term) for term in terms)
+                alternatives.append(rf"(?i:\b(?:{words})\b)")
+            patterns.append(f"(?P<{info_type}>{'|'.join(alternatives)})")
+        self.pattern = re.compile("|".join(patterns))
+
+    def _replace(self, match):
+        info_type = match.lastgroup
+        value = match.group()
+        if info_type == "CREDIT_CARD_NUMBER" and not luhn_valid(value):
+            return value
+        config = self.transformations[info_type]
+        if config.get("pseudonymize"):
+            return self.pseudonymizer.pseudonymize(info_type, value)
+        if config.get("mask"):
+            return mask(value)
+        return config.get("replace") or ""
+
+    def deidentify(self, line):
+        """Returns line with all the matched values transformed."""
+        return self.pattern.sub(self._replace, line)
+
+
+_worker = {}
+
+
+def _init_worker(transformations, pseudonymization_key):
+    """Builds the per process de-identifier and storage client."""
+    _worker["deidentifier"] = Deidentifier(transformations, pseudonymization_key)
+    _worker["client"] = storage.Client()
+
+
+def _deidentify_blob(source_bucket, target_bucket, blob_name, output_compression):
+    """De-identifies a CSV blob into a .log blob of the target bucket.
+
+    Returns:
+        The number of lines processed and the processing time in seconds.
+    """
+    start = time.monotonic()
+    deidentifier = _worker["deidentifier"]
+    client = _worker["client"]
+    source = client.bucket(source_bucket).blob(blob_name)
+    target_name = compression.strip_suffix(blob_name).replace(".csv", ".log")
+    target = client.bucket(target_bucket).blob(
+        compression.add_suffix(target_name, output_compression)
+    )
+    lines = 0
+    with compression.open_reader(source, text=True) as f_in:
+        with compression.open_writer(target, output_compression, text=True) as f_out:
+            for line in f_in:
+                f_out.write(deidentifier.deidentify(line))
+                lines += 1
+    return lines, time.monotonic() - start
+
+
+def deidentify_export(
+    source_bucket,
+    target_bucket,
+    folder_name,
+    transformations=None,
+    pseudonymization_key=None,
+    output_compression=None,
+    max_workers=None,
+    checkpoint=None,
+    deadline=None,
+    metrics=None,
+):
+    """De-identifies the CSV files of an export folder with a process pool.
+
+    Each file is streamed line by line from the source bucket to a .log file
+    with the same path in the target bucket, so neither the DLP file size
+    limit nor the split stage apply.
+
+    Args:
+        source_bucket: Name of the bucket holding the export.
+        target_bucket: Name of the bucket receiving the de-identified files.
+        folder_name: Export folder (export ID).
+        transformations: Optional infoType transformations (see Deidentifier).
+        pseudonymization_key: Optional key of the pseudonymization tokens.
+        output_compression: Optional compression (gzip or zstd) of the
+            de-identified files.
+        max_workers: Number of worker processes (defaults to the CPU count).
+        checkpoint: Optional Checkpoint of the processed files.
+        deadline: Optional time.monotonic() value after which no more files
+            are submitted.
+        metrics: Optional Metrics recording volumes and per file latencies.
+
+    Returns:
+        True if all the files were processed, False if the deadline was hit.
+
+    Raises:
+        ValueError: If the transformations are not valid (see Deidentifier).
+    """
+    # fail before starting the workers if the transformations are not valid
+    Deidentifier(transformations, pseudonymization_key)
+    metrics = metrics or Metrics()
+    storage_client = storage.Client()
+    blob_sizes = {
+        blob.name: blob.size
+        for blob in storage_client.list_blobs(source_bucket, prefix=f"{folder_name}/")
+        if compression.has_extension(blob.name, ".csv")
+        and not (checkpoint and checkpoint.is_done(blob.name))
+    }
+
+    workers = max_workers or os.cpu_count() or 1
+    completed = True
+    processed = lines = 0
+    pending = {}
+
+    def collect(done):
+        nonlocal processed, lines
+        for future in done:
+            blob_name = pending.pop(future)
+            if future.exception() is not None:
+                for other in pending:
+                    other.cancel()
+                raise future.exception()
+            file_lines, latency = future.result()
+            lines += file_lines
+            processed += 1
+            metrics.observe("deidentify.latency", latency)
+            metrics.increment("deidentify.files")
+            metrics.increment("deidentify.lines", file_lines)
+            metrics.increment("deidentify.bytes", blob_sizes[blob_name])
+            if checkpoint:
+                checkpoint.mark_done(blob_name)
+                if processed % CHECKPOINT_INTERVAL == 0:
+                    checkpoint.flush()
+
+    # spawned workers do not inherit the client threads of the parent process
+    try:
+        with futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(transformations, pseudonymization_key),
+        ) as pool:
+            for blob_name in blob_sizes:
+                if deadline and time.monotonic() > deadline:
+                    completed = False
+                    break
+                if len(pending) >= workers * 2:
+                    collect(
+                        futures.wait(pending, return_when=futures.FIRST_COMPLETED).done
+                    )
+                future = pool.submit(
+                    _deidentify_blob,
+                    source_bucket,
+                    target_bucket,
+                    blob_name,
+                    output_compression,
+                )
+                pending[future] = blob_name
+            collect(futures.wait(pending).done)
+    finally:
+        if checkpoint:
+            checkpoint.flush()
+
+    LOGGER.info(f"De-identified {lines} lines from {processed} files in {folder_name}.")
+    if completed and checkpoint:
+        checkpoint.clear()
+    return completed
@@ -0,0 +1,309 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent import futures
+from shared import compression
+from shared.batching import AdaptiveBatcher, status_code
+from shared.metrics import Metrics
+
+LOGGER = logging.getLogger("secops")
+"""Concurrent log ingestion engine used by the IMPORT-DATA action."""
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2.0
+_RETRIABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+CHECKPOINT_INTERVAL = 20  # Committed batches between checkpoint flushes
+_END_OF_STREAM = object()
+
+
+class IngestionEngine:
+    """Pipelined ingestion of GCS log files into a SecOps tenant.
+
+    Log files are read by a pool of reader threads which assemble batches and
+    push them on a bounded queue, while a separate pool of ingest workers
+    drains the queue and calls the Ingestion API. GCS reads, batch assembly
+    and ingest calls therefore overlap, and the queue bound caps the number of
+    batches held in memory at any time.
+
+    When a checkpoint is given, the number of lines of each file committed to
+    the tenant is recorded (batches may complete out of order, so only the
+    contiguous committed prefix is used as offset) and completed files are
+    marked as done, so that an interrupted run resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        chronicle,
+        forwarder_id,
+        file_workers=4,
+        ingest_workers=8,
+        max_pending_batches=None,
+        batcher=None,
+        transform=None,
+        metrics=None,
+    ):
+        """
+        Args:
+            chronicle: SecOps ChronicleClient of the target tenant.
+            forwarder_id: Forwarder ID used for ingestion.
+            file_workers: Number of log files read concurrently.
+            ingest_workers: Number of in-flight ingest_log calls.
+            max_pending_batches: Maximum number of assembled batches waiting
+                to be ingested (defaults to twice the ingest workers).
+            batcher: AdaptiveBatcher sizing each ingest_log call (defaults
+                to one with the default byte budget and line cap).
+            transform: Optional function applied to each log line before
+                batching (e.g. a de-identifier).
+            metrics: Optional Metrics recording read and ingest figures.
+        """
+        self.chronicle = chronicle
+        self.forwarder_id = forwarder_id
+        self.file_workers = max(1, int(file_workers))
+        self.ingest_workers = max(1, int(ingest_workers))
+        self.max_pending_batches = max(
+            1, int(max_pending_batches or self.ingest_workers * 2)
+        )
+        self.batcher = batcher or AdaptiveBatcher()
+        self.transform = transform
+        self.metrics = metrics or Metrics()
+        self._reset()
+
+    def _reset(self):
+        self._batches = queue.Queue(maxsize=self.max_pending_batches)
+        self._failed = threading.Event()
+        self._timed_out = threading.Event()
+        self._errors = []
+        self._lock = threading.Lock()
+        self._progress = {}
+        self._commits = 0
+        self.checkpoint = None
+        self.deadline = None
+        self.stats = {"files": 0, "lines": 0, "batches": 0, "bytes": 0, "retries": 0}
+
+    def _fail(self, error):
+        with self._lock:
+            self._errors.append(error)
+        self._failed.set()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _put(self, item):
+        """Enqueues a batch, giving up if the run has already failed."""
+        while not self._failed.is_set():
+            try:
+                self._batches.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _expired(self):
+        if self.deadline and time.monotonic() > self.deadline:
+            self._timed_out.set()
+        return self._timed_out.is_set()
+
+    def _read_file(self, bucket, log_type, blob_name):
+        """Reads a log file and enqueues its lines in batches."""
+        if self._expired():
+            return
+        offset = self.checkpoint.get_offset(blob_name) if self.checkpoint else 0
+        with self._lock:
+            self._progress[blob_name] = {"offset": offset, "ranges": {}, "end": None}
+        position = offset
+        blob = bucket.blob(blob_name)
+        with compression.open_reader(blob, text=True) as f:
+            lines = itertools.islice(f, offset, None)
+            if self.transform:
+                lines = map(self.transform, lines)
+            for logs, size in self.batcher.batches(lines):
+                if self._expired():
+                    return
+                if not self._put((log_type, logs, size, blob_name, position)):
+                    return
+                position += len(logs)
+        self._commit(blob_name, end=position)
+        self.metrics.increment("read.files")
+        self.metrics.increment("read.lines", position - offset)
+        LOGGER.debug(f"Read log file {blob_name}.")
+
+    def _commit(self, blob_name, start=None, end=None):
+        """Records committed lines (or the total lines read) of a file."""
+        flush = False
+        with self._lock:
+            progress = self._progress[blob_name]
+            if start is None:
+                progress["end"] = end
+            else:
+                progress["ranges"][start] = end
+                self._commits += 1
+                flush = self._commits % CHECKPOINT_INTERVAL == 0
+            while progress["offset"] in progress["ranges"]:
+                progress["offset"] = progress["ranges"].pop(progress["offset"])
+            file_done = progress["offset"] == progress["end"]
+            if file_done:
+                self.stats["files"] += 1
+            if self.checkpoint and file_done:
+                self.checkpoint.mark_done(blob_name)
+            elif self.checkpoint:
+                self.checkpoint.set_offset(blob_name, progress["offset"])
+        if self.checkpoint and flush:
+            self.checkpoint.flush()
+
+    def _ingest_worker(self):
+        """Drains the batch queue calling the Ingestion API."""
+        while True:
+            item = self._batches.get()
+            if item is _END_OF_STREAM:
+                return
+            if self._failed.is_set():
+                # keep draining so that readers are never blocked
+                continue
+            log_type, logs, size, blob_name, start = item
+            try:
+                self._ingest(log_type, logs, size)
+                self._commit(blob_name, start=start, end=start + len(logs))
+            except Exception as e:
+                LOGGER.error(f"Error ingesting {len(logs)} {log_type} logs: {e}")
+                self._fail(e)
+
+    def _ingest(self, log_type, logs, size):
+        """Ingests a batch, splitting it on 413 and retrying on 429/5xx."""
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.chronicle.ingest_log(
+                    log_message=logs,
+                    log_type=log_type,
+                    forwarder_id=self.forwarder_id,
+                )
+            except Exception as e:
+                code = status_code(e)
+                if code == 413 and len(logs) > 1:
+                    self.metrics.increment("ingest.too_large")
+                    self.batcher.record_too_large()
+                    half = len(logs) // 2
+                    head_size = size * half // len(logs)
+                    self._ingest(log_type, logs[:half], head_size)
+                    self._ingest(log_type, logs[half:], size - head_size)
+                    return
+                if code not in _RETRIABLE_STATUS_CODES or attempt >= MAX_RETRIES:
+                    raise
+                if code == 429:
+                    self.metrics.increment("ingest.throttled")
+                    self.batcher.record_throttled()
+                attempt += 1
+                self._count("retries")
+                self.metrics.increment("ingest.retries")
+                delay = random.uniform(0, RETRY_BASE_DELAY * 2**attempt)
+                LOGGER.warning(
+                    f"Ingestion failed with status {code}, retrying in {delay:.1f}s."
+                )
+                time.sleep(delay)
+                continue
+            latency = time.monotonic() - start
+            self.batcher.record_success(latency)
+            self.metrics.observe("ingest.latency", latency)
+            self.metrics.observe_size("ingest.batch_bytes", size)
+            self.metrics.increment("ingest.batches")
+            self.metrics.increment("ingest.lines", len(logs))
+            self.metrics.increment("ingest.bytes", size)
+            LOGGER.debug(response)
+            self._count("batches")
+            self._count("lines", len(logs))
+            self._count("bytes", size)
+            return
+
+    def run(self, bucket, log_files, checkpoint=None, deadline=None):
+        """Ingests a set of log files.
+
+        Args:
+            bucket: GCS bucket containing the log files.
+            log_files: Iterable of (log_type, blob_name) tuples, consumed
+                lazily so that files can be produced while others are read.
+            checkpoint: Optional Checkpoint of completed files and offsets.
+            deadline: Optional time.monotonic() value after which no more
+                lines are read.
+
+        Returns:
+            A dictionary with the number of files, lines, bytes and batches
+            ingested, the number of retried calls and whether all the files
+            were completed before the deadline.
+
+        Raises:
+            Exception: The first error raised while reading or ingesting, or
+                while iterating log_files.
+        """
+        self._reset()
+        self.checkpoint = checkpoint
+        self.deadline = deadline
+        workers = [
+            threading.Thread(target=self._ingest_worker, daemon=True)
+            for _ in range(self.ingest_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            with futures.ThreadPoolExecutor(max_workers=self.file_workers) as pool:
+                reads = {}
+
+                def collect(done):
+                    for read in done:
+                        blob_name = reads.pop(read)
+                        if read.exception() is not None:
+                            LOGGER.error(
+                                f"Error reading log file {blob_name}: {read.exception()}"
+                            )
+                            self._fail(read.exception())
+
+                # files are submitted as they are produced, bounded by the pool
+                for log_type, blob_name in log_files:
+                    if self._failed.is_set():
+                        break
+                    if checkpoint and checkpoint.is_done(blob_name):
+                        continue
+                    if len(reads) >= self.file_workers * 2:
+                        collect(
+                            futures.wait(
+                                reads, return_when=futures.FIRST_COMPLETED
+                            ).done
+                        )
+                    read = pool.submit(self._read_file, bucket, log_type, blob_name)
+                    reads[read] = blob_name
+                collect(futures.wait(reads).done)
+        finally:
+            for _ in workers:
+                self._batches.put(_END_OF_STREAM)
+            for worker in workers:
+                worker.join()
+            if checkpoint:
+                checkpoint.flush()
+
+        if self._errors:
+            raise self._errors[0]
+
+        LOGGER.info(
+            f"Ingested {self.stats['lines']} logs ({self.stats['bytes']}B) from "
+            f"{self.stats['files']} files in {self.stats['batches']} batches."
+        )
+        return dict(self.stats, completed=not self._timed_out.is_set())
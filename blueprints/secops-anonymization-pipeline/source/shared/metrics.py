@@ -0,0 +1,200 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import contextlib
+import functools
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+LOGGER = logging.getLogger("secops")
+"""Per-stage throughput, latency and retry metrics of the pipeline actions."""
+MAX_SAMPLES = 10000  # Latency and size samples kept per metric for percentiles
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, pct):
+    """Returns the pct percentile (nearest rank) of sorted samples."""
+    if not samples:
+        return None
+    rank = max(0, math.ceil(pct * len(samples) / 100) - 1)
+    return samples[rank]
+
+
+class Metrics:
+    """Thread-safe recorder of counters, latencies, sizes and stage durations.
+
+    Metric names are dotted, the first component being the stage (e.g.
+    ingest.bytes or ingest.latency). Counters of a stage whose duration was
+    recorded with stage() are also reported as per second rates. Latency and
+    size samples are kept up to MAX_SAMPLES per metric with reservoir
+    sampling, so memory stays bounded whatever the number of calls.
+    """
+
+    def __init__(self, action=None):
+        """
+        Args:
+            action: Name of the action the metrics belong to.
+        """
+        self.action = action
+        self.started = time.monotonic()
+        self._counters = {}
+        self._latencies = {}
+        self._sizes = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        """Adds value to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Records a latency sample."""
+        self._sample(self._latencies, name, seconds)
+
+    def observe_size(self, name, size):
+        """Records a size sample (e.g. the bytes of a request)."""
+        self._sample(self._sizes, name, size)
+
+    def _sample(self, series, name, value):
+        with self._lock:
+            sample = series.setdefault(
+                name, {"count": 0, "total": 0, "max": 0, "samples": []}
+            )
+            sample["count"] += 1
+            sample["total"] += value
+            sample["max"] = max(sample["max"], value)
+            if len(sample["samples"]) < MAX_SAMPLES:
+                sample["samples"].append(value)
+            else:
+                index = random.randrange(sample["count"])
+                if index < MAX_SAMPLES:
+                    sample["samples"][index] = value
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Records the duration of the enclosed block as a latency sample."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Adds the duration of the enclosed block to the duration of a stage."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stages[name] = (
+                    self._stages.get(name, 0.0) + time.monotonic() - start
+                )
+
+    def summary(self):
+        """Returns the metrics as a JSON serializable dictionary."""
+        with self._lock:
+            counters = dict(self._counters)
+            stages = dict(self._stages)
+            latencies = {
+                name: dict(latency, samples=sorted(latency["samples"]))
+                for name, latency in self._latencies.items()
+            }
+            sizes = {
+                name: dict(size, samples=sorted(size["samples"]))
+                for name, size in self._sizes.items()
+            }
+        rates = {}
+        for name, value in counters.items():
+            duration = stages.get(name.split(".")[0])
+            if duration:
+                rates[f"{name}_per_second"] = round(value / duration, 3)
+        summary = {
+            "action": self.action,
+            "duration_seconds": round(time.monotonic() - self.started, 3),
+            "stages": {name: round(value, 3) for name, value in stages.items()},
+            "counters": counters,
+            "rates": rates,
+            "latencies": {},
+            "sizes": {},
+        }
+        for name, latency in latencies.items():
+            summary["latencies"][name] = {
+                "count": latency["count"],
+                "mean": round(latency["total"] / latency["count"], 4),
+                "max": round(latency["max"], 4),
+                **{
+                    f"p{pct}": round(percentile(latency["samples"], pct), 4)
+                    for pct in PERCENTILES
+                },
+            }
+        for name, size in sizes.items():
+            summary["sizes"][name] = {
+                "count": size["count"],
+                "mean": round(size["total"] / size["count"], 1),
+                "max": size["max"],
+                **{f"p{pct}": percentile(size["samples"], pct) for pct in PERCENTILES},
+            }
+        return summary
+
+    def emit(self, path=None):
+        """Logs the summary as a structured record, writing it to path if set.
+
+        Args:
+            path: Optional local file receiving the JSON summary.
+        """
+        summary = self.summary()
+        # json_fields are exported as jsonPayload by the Cloud Logging handler
+        LOGGER.info(
+            f"Metrics of {self.action}: {json.dumps(summary)}",
+            extra={"json_fields": {"metrics": summary}},
+        )
+        if path:
+            with open(path, "w", encoding="utf8") as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+
+def instrumented(action, path=None):
+    """Decorates an action function recording and emitting its metrics.
+
+    The decorated function receives a Metrics instance in its metrics keyword
+    argument, unless the caller already passed one (e.g. an action invoked by
+    another action), in which case metrics are emitted by the caller.
+
+    Args:
+        action: Name of the action.
+        path: Optional local file receiving the JSON summary.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, metrics=None, **kwargs):
+            if metrics is not None:
+                return func(*args, metrics=metrics, **kwargs)
+            metrics = Metrics(action)
+            try:
+                return func(*args, metrics=metrics, **kwargs)
+            finally:
+                metrics.emit(path)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,78 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import functools
+import hashlib
+import hmac
+import ipaddress
+import logging
+
+LOGGER = logging.getLogger("secops")
+"""Deterministic keyed-hash pseudonymization of sensitive values."""
+DEFAULT_CACHE_SIZE = 262144  # Memoized values, roughly 64MB at most
+DEFAULT_TOKEN_LENGTH = 16
+IP_TOKEN_PREFIX = b"\xfd"  # IPv6 unique local addresses (fd00::/8)
+
+
+class Pseudonymizer:
+    """Replaces values with tokens derived from an HMAC-SHA256 of the value.
+
+    Tokens only depend on the key, the infoType and the value, so the same
+    value gets the same token across files, processes and days as long as the
+    key does not change. Tokens of the most recent values are memoized in a
+    bounded LRU cache, so repeated values cost a dictionary lookup instead of
+    a hash computation.
+    """
+
+    def __init__(
+        self,
+        key,
+        cache_size=DEFAULT_CACHE_SIZE,
+        token_length=DEFAULT_TOKEN_LENGTH,
+    ):
+        """
+        Args:
+            key: Secret key of the keyed hash.
+            cache_size: Maximum number of memoized tokens.
+            token_length: Number of hex characters of the generic tokens.
+        """
+        if not key:
+            raise ValueError("A pseudonymization key is required.")
+        self._key = key.encode("utf-8") if isinstance(key, str) else key
+        self.token_length = int(token_length)
+        self.pseudonymize = functools.lru_cache(maxsize=cache_size)(self._pseudonymize)
+
+    def _digest(self, info_type, value):
+        message = f"{info_type}:{value}".encode()
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def _pseudonymize(self, info_type, value):
+        """Returns the token of a value, keeping IPs and emails valid.
+
+        IP addresses are mapped to a unique local IPv6 address built from 120
+        bits of the digest, so that tokens do not collide even across the
+        whole IPv4 space.
+        """
+        digest = self._digest(info_type, value)
+        token = digest.hex()[: self.token_length]
+        if info_type == "IP_ADDRESS":
+            return str(ipaddress.IPv6Address(IP_TOKEN_PREFIX + digest[:15]))
+        if info_type == "EMAIL_ADDRESS":
+            return f"{token}@example.com"
+        return token
+
+    def cache_info(self):
+        """Returns the hits, misses and size of the token cache."""
+        return self.pseudonymize.cache_info()
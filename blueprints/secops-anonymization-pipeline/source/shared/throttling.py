@@ -0,0 +1,118 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import random
+import threading
+import time
+from concurrent import futures
+from shared.batching import status_code
+from shared.metrics import Metrics
+
+LOGGER = logging.getLogger("secops")
+"""Rate limiting and retry helpers for SecOps API calls."""
+RETRIABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at a minimum interval."""
+
+    def __init__(self, calls_per_second):
+        """
+        Args:
+            calls_per_second: Maximum call rate, 0 or None disables limiting.
+        """
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the next call is allowed."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def call_with_backoff(
+    func, max_retries=5, base_delay=2.0, rate_limiter=None, metrics=None, name="api"
+):
+    """Calls a function retrying throttled and server errors with backoff.
+
+    Args:
+        func: Function without arguments performing the API call.
+        max_retries: Maximum number of retries.
+        base_delay: Base delay (seconds) of the exponential backoff with jitter.
+        rate_limiter: Optional RateLimiter applied to every attempt.
+        metrics: Optional Metrics recording latencies, retries and throttling.
+        name: Prefix of the recorded metrics.
+
+    Returns:
+        The result of func.
+
+    Raises:
+        Exception: The last error raised by func, or the first non retriable one.
+    """
+    metrics = metrics or Metrics()
+    for attempt in range(max_retries + 1):
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            with metrics.timer(f"{name}.latency"):
+                return func()
+        except Exception as e:
+            code = status_code(e)
+            if code == 429:
+                metrics.increment(f"{name}.throttled")
+            if code not in RETRIABLE_STATUS_CODES or attempt == max_retries:
+                metrics.increment(f"{name}.errors")
+                raise
+            metrics.increment(f"{name}.retries")
+            delay = random.uniform(0, base_delay * 2 ** (attempt + 1))
+            LOGGER.warning(f"Call failed with status {code}, retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+def run_concurrently(func, items, max_workers):
+    """Calls a function on each item with a bounded pool of workers.
+
+    Errors are collected instead of raised, so that the results of the other
+    items are kept.
+
+    Args:
+        func: Function called with each item.
+        items: Hashable items, e.g. log types or export IDs.
+        max_workers: Maximum number of concurrent calls.
+
+    Returns:
+        A tuple with the results and the errors, as dictionaries keyed by item.
+    """
+    results = {}
+    errors = {}
+    if not items:
+        return results, errors
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        submissions = {pool.submit(func, item): item for item in items}
+        for submission in futures.as_completed(submissions):
+            item = submissions[submission]
+            try:
+                results[item] = submission.result()
+            except Exception as e:
+                errors[item] = e
+    return results, errors
@@ -13,16 +13,29 @@
 # limitations under the License.
 #
 
-import os
 import logging
-import math
-import csv
+import time as time_module
+from concurrent import futures
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 from datetime import datetime, timedelta, timezone, time
+from shared import compression
+from shared.checkpoint import PIPELINE_STATE_PREFIX, get_state_store
+from shared.compression import STREAM_CHUNK_SIZE
+from shared.metrics import Metrics
 
 LOGGER = logging.getLogger("secops")
 """Utility functions required for ingestion scripts."""
 MAX_FILE_SIZE = 61440000  # Max size supported by DLP
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 2
+DELETE_BATCH_SIZE = 100  # Max calls per GCS JSON API batch request
+EXPORT_MANIFEST_KEY = "exports.json"
+EXPORT_STATE_EXPORTED = "EXPORTED"
+EXPORT_STATE_ANONYMIZED = "ANONYMIZED"
+EXPORT_STATE_IMPORTED = "IMPORTED"
+EXPORT_STAGE_SUCCEEDED = "FINISHED_SUCCESS"
+EXPORT_STAGES_FAILED = ("FINISHED_FAILURE", "CANCELLED")
 
 
 def format_date_time_range(date_input):
@@ -46,63 +59,168 @@ def format_date_time_range(date_input):
     return start_of_day, end_of_day
 
 
-def list_anonymized_folders(bucket_name, folder_name):
-    """Lists all folders (prefixes) within a specified folder in a GCS bucket.
+def list_log_files_by_folder(bucket_name, folder_name):
+    """Groups the log files within a GCS bucket folder by subfolder.
+
+    All the objects below the folder are walked in a single paginated listing.
 
     Args:
         bucket_name: Name of the GCS bucket.
         folder_name: Name of the folder (prefix) to search within.
 
     Returns:
-        A list of folder names (prefixes) found.
+        A dictionary of subfolder name -> list of .log and .csv file names.
     """
-    folders = []
     storage_client = storage.Client()
+    log_files = {}
     for blob in storage_client.list_blobs(bucket_name, prefix=f"{folder_name}/"):
-        folder_name = blob.name.split("/")[1]
-        if folder_name not in folders:
-            folders.append(folder_name)
+        parts = blob.name.split("/")
+        if len(parts) < 3:
+            continue
+        if compression.has_extension(blob.name, ".log", ".csv"):
+            log_files.setdefault(parts[1], []).append(blob.name)
+
+    return log_files
 
-    return folders
 
+def _delete_blobs(storage_client, bucket, blob_names):
+    """Deletes blobs in a single batch request, one by one if the batch fails.
 
-def delete_folder(bucket_name, folder_name):
+    Returns:
+        The list of blob names that could not be deleted.
+    """
+    try:
+        with storage_client.batch():
+            for blob_name in blob_names:
+                bucket.delete_blob(blob_name)
+        return []
+    except Exception as e:
+        LOGGER.warning(f"Batch delete failed, deleting blobs one by one: {e}")
+
+    failed = []
+    for blob_name in blob_names:
+        try:
+            bucket.delete_blob(blob_name)
+        except NotFound:
+            pass
+        except Exception as e:
+            LOGGER.error(f"Error deleting {blob_name}: {e}")
+            failed.append(blob_name)
+    return failed
+
+
+def delete_folder(bucket_name, folder_name, max_workers=4):
     """Deletes a folder from a Google Cloud Storage bucket.
 
+    The folder is listed page by page and blobs are deleted in batch requests
+    of up to 100 deletions, sent by a small pool of workers.
+
     Args:
       bucket_name: The name of the bucket.
       folder_name: The name of the folder to delete.
+      max_workers: The number of concurrent batch requests.
+
+    Returns:
+      A tuple with the number of deleted blobs and the list of blob names that
+      could not be deleted.
     """
     storage_client = storage.Client()
     bucket = storage_client.bucket(bucket_name)
-    blobs = list(bucket.list_blobs(prefix=folder_name))
-    bucket.delete_blobs(blobs)
-    print(f"Folder {folder_name} deleted from bucket {bucket_name}")
-
 
-def list_log_files(bucket_name, folder_name):
-    """Lists all folders (prefixes) within a specified folder in a GCS bucket.
+    deleted = 0
+    failed = []
+    pending = {}
+
+    def collect(done):
+        nonlocal deleted
+        for future in done:
+            blob_names = pending.pop(future)
+            errors = future.result()
+            failed.extend(errors)
+            deleted += len(blob_names) - len(errors)
+        LOGGER.info(f"Deleted {deleted} blobs from {bucket_name}/{folder_name}.")
+
+    blobs = storage_client.list_blobs(bucket_name, prefix=f"{folder_name}/")
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for page in blobs.pages:
+            blob_names = [blob.name for blob in page]
+            for i in range(0, len(blob_names), DELETE_BATCH_SIZE):
+                if len(pending) >= max_workers * 2:
+                    collect(
+                        futures.wait(pending, return_when=futures.FIRST_COMPLETED).done
+                    )
+                batch = blob_names[i : i + DELETE_BATCH_SIZE]
+                future = pool.submit(_delete_blobs, storage_client, bucket, batch)
+                pending[future] = batch
+        collect(futures.wait(pending).done)
+
+    # folder placeholder object created by some GCS clients, usually missing
+    placeholder = f"{folder_name}_$folder$"
+    try:
+        bucket.delete_blob(placeholder)
+    except NotFound:
+        pass
+    except Exception as e:
+        LOGGER.error(f"Error deleting {placeholder}: {e}")
+        failed.append(placeholder)
+
+    if failed:
+        LOGGER.error(
+            f"Failed to delete {len(failed)} blobs from {bucket_name}/{folder_name}."
+        )
+    else:
+        LOGGER.info(f"Folder {folder_name} deleted from bucket {bucket_name}.")
+    return deleted, failed
+
+
+def get_export_size(bucket_name, folder_name):
+    """Returns the total size in bytes of the CSV files of an export folder.
 
     Args:
         bucket_name: Name of the GCS bucket.
-        folder_name: Name of the folder (prefix) to search within.
-
-    Returns:
-        A list of folder names (prefixes) found.
+        folder_name: Name of the export folder.
     """
-
     storage_client = storage.Client()
-    csv_files = []
-    for blob in storage_client.list_blobs(bucket_name, prefix=f"{folder_name}/"):
-        if blob.name.endswith(".log") or blob.name.endswith(".csv"):
-            csv_files.append(blob.name)
+    return sum(
+        blob.size
+        for blob in storage_client.list_blobs(bucket_name, prefix=f"{folder_name}/")
+        if compression.has_extension(blob.name, ".csv")
+    )
+
 
-    return csv_files
+def iter_csv_records(stream):
+    """Yields raw CSV records from a binary stream.
 
+    Physical lines are grouped until all the quotes they contain are balanced,
+    so that quoted fields spanning multiple lines are never split across two
+    records. Escaped quotes ("") do not alter the balance.
+
+    Args:
+        stream: Binary file-like object (e.g. a GCS BlobReader).
 
-def split_csv(bucket_name, blob_name, file_size):
+    Yields:
+        The raw bytes of each record, including the trailing newline.
+    """
+    lines = []
+    quotes = 0
+    for line in stream:
+        lines.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            yield b"".join(lines)
+            lines = []
+            quotes = 0
+    if lines:
+        yield b"".join(lines)
+
+
+def split_csv(bucket_name, blob_name, max_file_size=MAX_FILE_SIZE):
     """Splits a CSV file into smaller chunks and uploads them back to the bucket.
 
+    The source blob is left in place for the caller to delete. The blob is streamed through a chunked reader in a single pass and each
+    chunk is streamed straight to its own blob, cutting chunks on record
+    boundaries as soon as the next record would exceed max_file_size.
+
     Args:
       bucket_name: The name of the GCS bucket.
       blob_name: The name of the CSV blob in the bucket.
@@ -112,83 +230,278 @@ def split_csv(bucket_name, blob_name, file_size):
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
 
-    # Download the blob to a local file
-    temp_file = "/tmp/temp.csv"
-    blob.download_to_filename(temp_file)
-
-    file = open(temp_file, encoding="utf8")
-    numline = sum(1 for row in csv.reader(file))
-
-    # Read the CSV file in chunks
-    chunk_number = math.ceil(numline * MAX_FILE_SIZE / file_size)
     index = 0
-    lines = []
-    with open(temp_file, "r", encoding="utf8") as f_in:
-        reader = csv.reader(f_in, delimiter="\n")
-        for line in reader:
-            lines.append(line[0] + "\n")
-            if len(lines) == chunk_number:
-                chunk_filename = f"{blob_name.split('.')[0]}_{index}.log"
-                chunk_path = f"/tmp/temp-{index}.csv"
-                with open(chunk_path, "w") as fout:
-                    fout.writelines(lines)
-                chunk_blob = bucket.blob(f"{chunk_filename}")
-                chunk_blob.upload_from_filename(chunk_path)
-                print(f"Uploaded {chunk_filename} to {bucket_name}")
-                os.remove(chunk_path)  # Remove the local chunk file
+    chunk = None
+    chunk_filename = None
+    chunk_size = 0
+    with compression.open_reader(blob) as f_in:
+        for record in iter_csv_records(f_in):
+            if not record.endswith(b"\n"):
+                record += b"\n"
+            if chunk is not None and chunk_size + len(record) > max_file_size:
+                chunk.close()
+                LOGGER.debug(f"Uploaded {chunk_filename} to {bucket_name}.")
+                chunk = None
                 index += 1
-                lines = []
-
-        chunk_filename = f"{blob_name.split('.')[0]}_{index}.log"
-        chunk_path = f"/tmp/temp-{index}.csv"
-        with open(chunk_path, "w") as fout:
-            fout.writelines(lines)
-        chunk_blob = bucket.blob(f"{chunk_filename}")
-        chunk_blob.upload_from_filename(chunk_path)
-        print(f"Uploaded {chunk_filename} to {bucket_name}")
-        os.remove(chunk_path)  # Remove the local chunk file
-        index += 1
-        lines = []
-
-    # Remove the temporary file
-    os.remove(temp_file)
-
-    # remove old log file
-    blob = bucket.blob(blob_name)
-    blob.delete()
+            if chunk is None:
+                chunk_filename = f"{blob_name.split('.')[0]}_{index}.log"
+                chunk = bucket.blob(chunk_filename).open(
+                    "wb", chunk_size=STREAM_CHUNK_SIZE, content_type="text/plain"
+                )
+                chunk_size = 0
+            chunk.write(record)
+            chunk_size += len(record)
+
+    if chunk is not None:
+        chunk.close()
+        LOGGER.debug(f"Uploaded {chunk_filename} to {bucket_name}.")
 
 
-def split_and_rename_csv_to_log_files(bucket_name, folder_name):
+def _split_or_rename(bucket, blob, metrics):
+    """Splits a large CSV blob or renames it to .log, retrying on failure.
+
+    Once a blob is split, retries only delete the source blob.
+    """
+    split = False
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            if attempt > 0 and not bucket.blob(blob.name).exists():
+                # a previous attempt completed but failed to report it
+                return
+            # compressed blobs are always split, DLP only reads plain text
+            if compression.get_compression(blob.name) or blob.size >= MAX_FILE_SIZE:
+                if not split:
+                    with metrics.timer("split.latency"):
+                        split_csv(bucket.name, blob.name)
+                    metrics.increment("split.bytes", blob.size)
+                    split = True
+                bucket.delete_blob(blob.name)
+            else:
+                with metrics.timer("rename.latency"):
+                    bucket.rename_blob(blob, blob.name.replace(".csv", ".log"))
+            metrics.increment("split.files")
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            metrics.increment("split.retries")
+            delay = RETRY_BASE_DELAY * 2**attempt
+            LOGGER.warning(f"Error processing {blob.name}, retrying in {delay}s: {e}")
+            time_module.sleep(delay)
+
+
+def split_and_rename_csv_to_log_files(
+    bucket_name,
+    folder_name,
+    max_workers=8,
+    deadline=None,
+    metrics=None,
+):
     """Renames all .csv files to .log files within a GCS bucket folder (and subfolders).
 
+    Blobs are processed by a pool of workers and each blob is retried on
+    failure. Processed blobs no longer have a .csv extension, so an
+    interrupted run is resumed by listing the folder again.
+
     Args:
         bucket_name (str): Name of the GCS bucket.
-        folder_prefix (str): Prefix of the folder within the bucket to process.
+        folder_name (str): Prefix of the folder within the bucket to process.
+        max_workers (int): Number of blobs processed concurrently.
+        deadline (float): Optional time.monotonic() value after which no more
+            blobs are submitted.
+        metrics (Metrics): Optional recorder of split latencies and volumes.
+
+    Returns:
+        True if all the blobs were processed, False if the deadline was hit.
     """
 
+    metrics = metrics or Metrics()
     storage_client = storage.Client()
     bucket = storage_client.bucket(bucket_name)
 
-    blobs = storage_client.list_blobs(bucket, prefix=f"{folder_name}/")
-    for blob in blobs:
-        if blob.name.endswith(".csv") and blob.size >= MAX_FILE_SIZE:
-            split_csv(bucket_name, blob.name, blob.size)
-        elif blob.name.endswith(".csv"):
-            new_name = blob.name.replace(".csv", ".log")
-            bucket.rename_blob(blob, new_name)
+    completed = True
+    processed = 0
+    pending = {}
+
+    def collect(done):
+        nonlocal processed
+        for future in done:
+            pending.pop(future)
+            if future.exception() is not None:
+                raise future.exception()
+            processed += 1
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for blob in storage_client.list_blobs(bucket, prefix=f"{folder_name}/"):
+            if not compression.has_extension(blob.name, ".csv"):
+                continue
+            if deadline and time_module.monotonic() > deadline:
+                completed = False
+                break
+            if len(pending) >= max_workers * 2:
+                collect(futures.wait(pending, return_when=futures.FIRST_COMPLETED).done)
+            pending[pool.submit(_split_or_rename, bucket, blob, metrics)] = blob.name
+        collect(futures.wait(pending).done)
+
+    LOGGER.info(f"Processed {processed} CSV files in {folder_name}.")
+    return completed
+
+
+def watch_export_shards(
+    bucket_name, export_ids, get_export, poll_interval=60, deadline=None
+):
+    """Yields the CSV shards of running exports as soon as they land.
+
+    The export folders are listed every poll_interval seconds and new shards
+    are yielded right away, an export is dropped once its status is
+    FINISHED_SUCCESS and a final listing has been done.
+
+    Args:
+        bucket_name: Name of the export bucket.
+        export_ids: IDs of the exports to watch.
+        get_export: Function returning the Data Export API status of an export.
+        poll_interval: Seconds between two listings.
+        deadline: Optional time.monotonic() value after which watching stops.
+
+    Yields:
+        Tuples of (log type, blob name).
+
+    Raises:
+        RuntimeError: If an export fails or is cancelled.
+        TimeoutError: If the deadline is hit before all exports finished.
+    """
+    storage_client = storage.Client()
+    pending = set(export_ids)
+    seen = set()
+    while pending:
+        for export_id in sorted(pending):
+            # read the status first, so that no shard is missed by the listing
+            stage = get_export(export_id)["dataExportStatus"]["stage"]
+            if stage in EXPORT_STAGES_FAILED:
+                raise RuntimeError(f"Export {export_id} ended with stage {stage}.")
+            for blob in storage_client.list_blobs(bucket_name, prefix=f"{export_id}/"):
+                parts = blob.name.split("/")
+                if (
+                    len(parts) < 3
+                    or not compression.has_extension(blob.name, ".csv")
+                    or blob.name in seen
+                ):
+                    continue
+                seen.add(blob.name)
+                yield parts[1].split("-")[0], blob.name
+            if stage == EXPORT_STAGE_SUCCEEDED:
+                LOGGER.info(f"Export {export_id} finished.")
+                pending.discard(export_id)
+        if not pending:
+            break
+        if deadline and time_module.monotonic() + poll_interval > deadline:
+            raise TimeoutError(f"Exports {sorted(pending)} not finished in time.")
+        time_module.sleep(poll_interval)
+
+
+def list_export_folders(bucket_name):
+    """Lists the top-level folders (export IDs) of a GCS bucket.
+
+    Uses a delimiter listing, so the cost depends on the number of folders
+    rather than on the number of objects they contain.
 
+    Args:
+        bucket_name: Name of the GCS bucket.
 
-def get_secops_export_folders_for_date(bucket_name, export_date):
+    Returns:
+        A set of folder names.
+    """
     storage_client = storage.Client()
-    export_ids = []
+    blobs = storage_client.list_blobs(bucket_name, delimiter="/")
+    for _ in blobs:
+        pass  # prefixes are populated while pages are consumed
+    return {
+        prefix.rstrip("/")
+        for prefix in blobs.prefixes
+        if not prefix.startswith(PIPELINE_STATE_PREFIX)
+    }
+
+
+def get_secops_export_folders_for_date(bucket_name, export_date, state_store=None):
+    """Returns the export IDs created on a specific date.
+
+    Export folders are tracked in a manifest (export_id -> date, state) kept in
+    the bucket: only folders missing from the manifest are inspected, reading
+    the creation time of their first object, and folders no longer present in
+    the bucket are dropped from it.
+
+    Args:
+        bucket_name: Name of the GCS bucket.
+        export_date: Date of the exports (format %Y-%m-%d).
+        state_store: Optional store holding the manifest (defaults to the
+            bucket itself).
+
+    Returns:
+        A list of export IDs.
+    """
+    store = state_store or get_state_store(bucket_name)
+    manifest = store.load(EXPORT_MANIFEST_KEY) or {}
+    folders = list_export_folders(bucket_name)
+
+    changed = False
+    for export_id in set(manifest) - folders:
+        del manifest[export_id]
+        changed = True
 
-    for blob in storage_client.list_blobs(bucket_name):
-        if "_$folder$" in blob.name:
+    storage_client = storage.Client()
+    for export_id in sorted(folders - set(manifest)):
+        first_blob = next(
+            iter(
+                storage_client.list_blobs(
+                    bucket_name, prefix=f"{export_id}/", max_results=1
+                )
+            ),
+            None,
+        )
+        if first_blob is None:
             continue
-        if (
-            blob.time_created.strftime("%Y-%m-%d") == export_date
-            and blob.name.split("/")[0] not in export_ids
-        ):
-            export_ids.append(blob.name.split("/")[0])
+        manifest[export_id] = {
+            "date": first_blob.time_created.strftime("%Y-%m-%d"),
+            "state": EXPORT_STATE_EXPORTED,
+        }
+        changed = True
+
+    if changed:
+        store.save(EXPORT_MANIFEST_KEY, manifest)
+
+    return [
+        export_id
+        for export_id, export in sorted(manifest.items())
+        if export["date"] == export_date
+    ]
+
+
+def get_export_states(bucket_name, state_store=None):
+    """Returns the state of the exports tracked in the bucket manifest.
+
+    Args:
+        bucket_name: Name of the GCS bucket.
+        state_store: Optional store holding the manifest.
 
-    return export_ids
+    Returns:
+        A dictionary of export_id -> state.
+    """
+    store = state_store or get_state_store(bucket_name)
+    manifest = store.load(EXPORT_MANIFEST_KEY) or {}
+    return {export_id: export["state"] for export_id, export in manifest.items()}
+
+
+def update_export_state(bucket_name, export_id, state, state_store=None):
+    """Updates the state of an export in the bucket manifest.
+
+    Args:
+        bucket_name: Name of the GCS bucket.
+        export_id: ID of the export.
+        state: New state of the export.
+        state_store: Optional store holding the manifest.
+    """
+    store = state_store or get_state_store(bucket_name)
+    manifest = store.load(EXPORT_MANIFEST_KEY) or {}
+    if export_id in manifest:
+        manifest[export_id]["state"] = state
+        store.save(EXPORT_MANIFEST_KEY, manifest)
@@ -56,6 +56,53 @@ variable "dlp_config" {
   default = null
 }
 
+variable "pipeline_config" {
+  description = "Optional tuning of the pipeline stages."
+  type = object({
+    ingest = optional(object({
+      file_workers        = optional(number, 4)
+      workers             = optional(number, 8)
+      max_pending_batches = optional(number, 16)
+      max_batch_bytes     = optional(number, 3145728)
+      max_batch_lines     = optional(number, 5000)
+    }), {})
+    dlp = optional(object({
+      workers = optional(number, 8)
+    }), {})
+    export = optional(object({
+      workers = optional(number, 3)
+      rate    = optional(number, 1)
+    }), {})
+    local_deidentify = optional(object({
+      enabled              = optional(bool, false)
+      max_export_bytes     = optional(number, 0)
+      workers              = optional(number, 0)
+      pseudonymization_key = optional(string, "")
+      output_compression   = optional(string, "")
+      info_types = optional(map(object({
+        replace      = optional(string)
+        mask         = optional(bool)
+        pseudonymize = optional(bool)
+        terms        = optional(list(string))
+      })), {})
+    }), {})
+    pipeline = optional(object({
+      poll_interval = optional(number, 60)
+    }), {})
+    split = optional(object({
+      workers = optional(number, 8)
+    }), {})
+  })
+  default  = {}
+  nullable = false
+  validation {
+    condition = contains(
+      ["", "gzip", "zstd"], var.pipeline_config.local_deidentify.output_compression
+    )
+    error_message = "Output compression must be either empty, 'gzip' or 'zstd'."
+  }
+}
+
 variable "prefix" {
   description = "Prefix used for resource names."
   type        = string
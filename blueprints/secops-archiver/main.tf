@@ -62,7 +62,7 @@ module "export-bucket" {
   storage_class = "ARCHIVE"
   versioning    = true
   iam = {
-    "roles/storage.objectViewer" = [module.function.service_account_iam_email]
+    "roles/storage.objectAdmin" = [module.function.service_account_iam_email]
   }
 }
 
@@ -86,11 +86,17 @@ module "function" {
     path = "${path.module}/source"
   }
   environment_variables = merge({
-    GCP_PROJECT        = module.project.project_id
-    SECOPS_PROJECT_ID  = var.secops_config.gcp_project
-    SECOPS_CUSTOMER_ID = var.secops_config.customer_id
-    SECOPS_REGION      = var.secops_config.region
-    GCS_BUCKET         = module.export-bucket.name
+    GCP_PROJECT             = module.project.project_id
+    SECOPS_PROJECT_ID       = var.secops_config.gcp_project
+    SECOPS_CUSTOMER_ID      = var.secops_config.customer_id
+    SECOPS_REGION           = var.secops_config.region
+    GCS_BUCKET              = module.export-bucket.name
+    EXPORT_CONCURRENCY      = var.export_config.concurrency
+    EXPORT_WINDOW_MAX_BYTES = var.export_config.window_max_bytes
+    EXPORT_MAX_ATTEMPTS     = var.export_config.max_attempts
+    EXPORT_RATE             = var.export_config.rate
+    EXPORT_POLL_INTERVAL    = var.export_config.poll_interval
+    FUNCTION_TIMEOUT        = var.cloud_function_config.timeout_seconds
   })
   function_config = {
     cpu             = var.cloud_function_config.cpu
@@ -150,10 +156,16 @@ resource "google_cloud_scheduler_job" "anonymization_jobs" {
   http_target {
     http_method = "POST"
     uri         = module.function.uri
-    body = base64encode(jsonencode({
-      ACTION    = upper(each.value.action)
-      LOG_TYPES = each.value.log_types
-    }))
+    body = base64encode(jsonencode(merge(
+      {
+        ACTION    = upper(each.value.action)
+        LOG_TYPES = each.value.log_types
+      },
+      each.value.backfill == null ? {} : {
+        BACKFILL_START_DATE = each.value.backfill.start_date
+        BACKFILL_END_DATE   = each.value.backfill.end_date
+      }
+    )))
     headers = { "Content-Type" : "application/json" }
     oidc_token {
       service_account_email = module.scheduler-sa.email
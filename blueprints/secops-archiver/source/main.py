@@ -14,15 +14,22 @@
 # limitations under the License.
 
 import binascii
+import functools
+import hashlib
 import json
+import math
 import os
+import time
 import click
 import logging
 import google.cloud.logging
-from datetime import date, timedelta, datetime
+from concurrent import futures
+from datetime import date, timedelta, datetime, timezone
+from google.cloud import storage
 from secops import SecOpsClient
 from dotenv import load_dotenv
 from dateutil.relativedelta import relativedelta
+from shared.throttling import RateLimiter, run_concurrently
 
 load_dotenv()
 
@@ -43,88 +50,587 @@ SECOPS_CUSTOMER_ID = os.environ.get("SECOPS_CUSTOMER_ID")
 SECOPS_PROJECT_ID = os.environ.get("SECOPS_PROJECT_ID")
 MONTHS_TO_LOOK_BACK = os.environ.get("MONTHS_TO_LOOK_BACK", 11)
 
-HUNDRED_TERABYTES = 99000000000000
-
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", 3))
+EXPORT_WINDOW_MAX_BYTES = int(os.environ.get("EXPORT_WINDOW_MAX_BYTES", 10000000000000))
+EXPORT_MAX_ATTEMPTS = int(os.environ.get("EXPORT_MAX_ATTEMPTS", 3))
+EXPORT_RATE = float(os.environ.get("EXPORT_RATE", 1))
+EXPORT_POLL_INTERVAL = int(os.environ.get("EXPORT_POLL_INTERVAL", 300))
+FUNCTION_TIMEOUT = int(os.environ.get("FUNCTION_TIMEOUT", 3600))
 
-def trigger_export(
-    export_start_datetime: str, export_end_datetime: str, log_types: str
-):
+HUNDRED_TERABYTES = 99000000000000
+STATE_PREFIX = "_archiver"  # Objects of the bucket holding the archiver state
+EXPORT_STAGES_RUNNING = ("IN_QUEUE", "PROCESSING")
+EXPORT_STAGES_FAILED = ("FINISHED_FAILURE", "CANCELLED")
+LIST_PAGE_SIZE = 1000
+DETAIL_WORKERS = 8  # Concurrent get_data_export calls when checking exports
+MANIFEST_KEY = "manifest.json"
+WINDOW_PENDING = "PENDING"
+WINDOW_FAILED = "FAILED"
+DEADLINE_MARGIN = 120  # Seconds reserved to persist the plan before timeout
+EXPORT_RATE_LIMITER = RateLimiter(EXPORT_RATE)
+
+
+@functools.cache
+def get_chronicle():
     """
-    Trigger secops export using Data Export API for a specific date
-    :param secops_source_sa_key_secret_path:
-    :param secops_export_bucket:
-    :param secops_target_project_id:
-    :param log_types:
-    :param export_end_datetime:
-    :param export_start_datetime:
-    :param date: datetime (as string) with DD-MM-YYYY format
-    :return:
+    Build the SecOps client once per function instance.
+    :return: ChronicleClient
     """
-
-    client = SecOpsClient()
-    chronicle = client.chronicle(
+    return SecOpsClient().chronicle(
         customer_id=SECOPS_CUSTOMER_ID,
         project_id=SECOPS_PROJECT_ID,
         region=SECOPS_REGION,
     )
 
-    export_ids = []
 
-    start_time, end_time = (
-        datetime.strptime(export_start_datetime, "%Y-%m-%dT%H:%M:%SZ"),
-        datetime.strptime(export_end_datetime, "%Y-%m-%dT%H:%M:%SZ"),
+def load_state(key: str):
+    """
+    Load a JSON state document from the archive bucket.
+    :param key: name of the document under the state prefix
+    :return: the document, None if missing
+    """
+    blob = storage.Client().bucket(GCS_BUCKET).blob(f"{STATE_PREFIX}/{key}")
+    if not blob.exists():
+        return None
+    return json.loads(blob.download_as_text())
+
+
+def save_state(key: str, state: dict):
+    """
+    Save a JSON state document to the archive bucket.
+    :param key: name of the document under the state prefix
+    :param state: document to save
+    :return:
+    """
+    blob = storage.Client().bucket(GCS_BUCKET).blob(f"{STATE_PREFIX}/{key}")
+    # state is rewritten on every run, keep it out of the archive storage class
+    blob.storage_class = "STANDARD"
+    blob.upload_from_string(json.dumps(state), content_type="application/json")
+
+
+def load_manifest():
+    """
+    Load the manifest of the exports written to the archive bucket.
+    :return: manifest with the exports by ID
+    """
+    return load_state(MANIFEST_KEY) or {"exports": {}}
+
+
+def get_archive_bucket():
+    """
+    Build the Data Export API name of the archive bucket.
+    :return: bucket name as projects/PROJECT/buckets/BUCKET
+    """
+    return f"projects/{GCP_PROJECT_ID}/buckets/{GCS_BUCKET}"
+
+
+def record_export(manifest: dict, export: dict, window: dict | None = None):
+    """
+    Add or update the manifest entry of an export from a Data Export API
+    payload, with its time window, log types, volume and stage.
+    :param manifest: manifest of the archive bucket
+    :param export: Data Export API payload of the export
+    :param window: export window of the plan the export was triggered for
+    :return: export ID, None for exports to other buckets which are skipped
+    """
+    if window is None and export.get("gcsBucket") != get_archive_bucket():
+        # exports of other pipelines or to other buckets archive nothing here
+        return None
+    export_id = export["name"].split("/")[-1]
+    entry = manifest["exports"].setdefault(export_id, {})
+    if window is not None:
+        entry.update(
+            start=window["start"],
+            end=window["end"],
+            log_types=[window["log_type"]] if window["log_type"] else None,
+        )
+    elif "startTime" in export and "endTime" in export:
+        start = datetime.strptime(export["startTime"][:19], "%Y-%m-%dT%H:%M:%S")
+        end = datetime.strptime(export["endTime"][:19], "%Y-%m-%dT%H:%M:%S")
+        if end.time() == datetime.min.time() and end > start:
+            end -= timedelta(days=1)  # exclusive end time
+        entry.update(start=f"{start:%Y-%m-%d}", end=f"{end:%Y-%m-%d}")
+    if "includeLogTypes" in export:
+        entry["log_types"] = [t.split("/")[-1] for t in export["includeLogTypes"]]
+    elif export.get("exportAllLogs"):
+        entry["log_types"] = None
+    if "created" not in entry:
+        entry["created"] = export.get(
+            "createTime", datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        )
+    for key, field in (
+        ("estimated_volume", "estimatedVolume"),
+        ("exported_volume", "exportedVolume"),
+    ):
+        if field in export:
+            entry[key] = int(export[field])
+    stage = export.get("dataExportStatus", {}).get("stage")
+    if stage:
+        entry["stage"] = stage
+    entry.setdefault("stage", "IN_QUEUE")
+    return export_id
+
+
+def new_window(log_type, start: date, end: date):
+    """
+    Build a pending export window.
+    :param log_type: log type of the window, None for all log types
+    :param start: first day of the window
+    :param end: last day of the window
+    :return: export window
+    """
+    return {
+        "log_type": log_type,
+        "start": start.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "stage": WINDOW_PENDING,
+        "export_id": None,
+        "estimated_volume": None,
+        "attempts": 0,
+    }
+
+
+def window_key(window: dict):
+    return f"{window['log_type'] or 'ALL'}/{window['start']}/{window['end']}"
+
+
+def split_window(window: dict, estimated_volume: int):
+    """
+    Split a window in week or day windows sized by its estimated volume.
+    :param window: export window exceeding the maximum window volume
+    :param estimated_volume: estimated volume of the window export
+    :return: list of smaller export windows
+    """
+    start = datetime.strptime(window["start"], "%Y-%m-%d").date()
+    end = datetime.strptime(window["end"], "%Y-%m-%d").date()
+    days = (end - start).days + 1
+    slices = math.ceil(estimated_volume / EXPORT_WINDOW_MAX_BYTES)
+    # weeks are enough as long as each one stays below the maximum volume
+    step = 7 if days > 7 and math.ceil(days / 7) >= slices else 1
+    windows = []
+    while start <= end:
+        last = min(start + timedelta(days=step - 1), end)
+        windows.append(new_window(window["log_type"], start, last))
+        start = last + timedelta(days=1)
+    return windows
+
+
+def submit_window(window: dict):
+    """
+    Trigger the secops export of a window using Data Export API.
+    :param window: export window
+    :return: export request response
+    """
+    gcs_bucket = get_archive_bucket()
+    log_types = (
+        {"export_all_logs": True}
+        if window["log_type"] is None
+        else {"log_types": [window["log_type"]]}
+    )
+    EXPORT_RATE_LIMITER.wait()
+    return get_chronicle().create_data_export(
+        start_time=datetime.strptime(window["start"], "%Y-%m-%d"),
+        end_time=datetime.strptime(window["end"], "%Y-%m-%d").replace(
+            hour=23, minute=59, second=59
+        ),
+        gcs_bucket=gcs_bucket,
+        **log_types,
     )
 
-    gcs_bucket = f"projects/{GCP_PROJECT_ID}/buckets/{GCS_BUCKET}"
 
-    try:
-        if log_types is None or log_types == "":
-            export_response = chronicle.create_data_export(
-                start_time=start_time,
-                end_time=end_time,
-                gcs_bucket=gcs_bucket,
-                export_all_logs=True,
+def refresh_windows(windows: dict, manifest: dict):
+    """
+    Update the stage of the running windows, re-queueing failed ones.
+    :param windows: export windows of the plan by key
+    :param manifest: manifest of the archive bucket
+    :return:
+    """
+    chronicle = get_chronicle()
+    running = [w for w in windows.values() if w["stage"] in EXPORT_STAGES_RUNNING]
+    if not running:
+        return
+    with futures.ThreadPoolExecutor(max_workers=EXPORT_CONCURRENCY) as pool:
+        exports = pool.map(
+            lambda w: chronicle.get_data_export(data_export_id=w["export_id"]),
+            running,
+        )
+        for window, export in zip(running, exports):
+            record_export(manifest, export, window)
+            stage = export.get("dataExportStatus", {}).get("stage", window["stage"])
+            if stage in EXPORT_STAGES_FAILED:
+                LOGGER.warning(
+                    f"Export {window['export_id']} of {window_key(window)} ended "
+                    f"with {stage}."
+                )
+                window["error"] = stage
+                stage = (
+                    WINDOW_PENDING
+                    if window["attempts"] < EXPORT_MAX_ATTEMPTS
+                    else WINDOW_FAILED
+                )
+            window["stage"] = stage
+
+
+def submit_windows(windows: dict, manifest: dict):
+    """
+    Submit pending windows while less than EXPORT_CONCURRENCY exports run.
+    Windows whose estimated volume exceeds EXPORT_WINDOW_MAX_BYTES are
+    cancelled and replaced by week or day windows.
+    :param windows: export windows of the plan by key
+    :param manifest: manifest of the archive bucket
+    :return: list of the triggered export IDs
+    """
+    chronicle = get_chronicle()
+    export_ids = []
+    tried = set()
+    while True:
+        running = sum(w["stage"] in EXPORT_STAGES_RUNNING for w in windows.values())
+        pending = sorted(
+            (
+                key
+                for key, w in windows.items()
+                if w["stage"] == WINDOW_PENDING and key not in tried
+            ),
+            key=lambda key: (windows[key]["start"], key),
+        )[: max(0, EXPORT_CONCURRENCY - running)]
+        if not pending:
+            return export_ids
+        tried.update(pending)
+        responses, errors = run_concurrently(
+            lambda key: submit_window(windows[key]), pending, len(pending)
+        )
+        for key in pending:
+            window = windows[key]
+            window["attempts"] += 1
+            if key in errors:
+                LOGGER.error(f"Error during export of {key}: {errors[key]}")
+                window["error"] = str(errors[key])
+                if window["attempts"] >= EXPORT_MAX_ATTEMPTS:
+                    window["stage"] = WINDOW_FAILED
+                continue
+            response = responses[key]
+            LOGGER.info(f"Export request response: {response}")
+            export_id = record_export(manifest, response, window)
+            volume = int(response.get("estimatedVolume", 0))
+            window.update(
+                export_id=export_id,
+                estimated_volume=volume,
+                stage=response.get("dataExportStatus", {}).get("stage", "IN_QUEUE"),
             )
-            LOGGER.info(export_response)
-            export_id = export_response["name"].split("/")[-1]
-            LOGGER.info(f"Export request response: {export_response}")
-            if (
-                "estimatedVolume" in export_response
-                and int(export_response["estimatedVolume"]) > HUNDRED_TERABYTES
-            ):
-                raise SystemExit(
-                    f"Export with ID: {export_id} might result in more than 100TB of data. This might result in data loss, please check this."
+            window.pop("error", None)
+            if volume > EXPORT_WINDOW_MAX_BYTES and window["start"] != window["end"]:
+                try:
+                    EXPORT_RATE_LIMITER.wait()
+                    chronicle.cancel_data_export(data_export_id=export_id)
+                except Exception as e:
+                    # e.g. already finished or throttled, the export is kept whole
+                    LOGGER.warning(
+                        f"Error cancelling export {export_id} of {key}, keeping "
+                        f"the window whole: {e}"
+                    )
+                    export_ids.append(export_id)
+                    continue
+                manifest["exports"][export_id]["stage"] = "CANCELLED"
+                del windows[key]
+                slices = split_window(window, volume)
+                LOGGER.info(
+                    f"Export {export_id} of {key} estimated at {volume} bytes, "
+                    f"split in {len(slices)} windows."
                 )
+                windows.update((window_key(w), w) for w in slices)
+                continue
             export_ids.append(export_id)
             LOGGER.info(f"Triggered export with ID: {export_id}")
-        else:
-            export_response = chronicle.create_data_export(
-                start_time=start_time,
-                end_time=end_time,
-                gcs_bucket=gcs_bucket,
-                log_types=log_types.split(","),
+
+
+def advance_plan(plan_key: str, build_windows):
+    """
+    Advance a persisted export plan: track the running windows, re-run the
+    failed ones and submit the pending ones within the export concurrency
+    quota. Windows which failed EXPORT_MAX_ATTEMPTS times in a previous run
+    are queued again with a fresh set of attempts. Running windows are polled
+    every EXPORT_POLL_INTERVAL seconds and pending ones submitted as soon as
+    a slot is freed, until all the windows are submitted or the function
+    timeout is close; the same plan is then advanced by the next run.
+    :param plan_key: name of the plan under the state prefix
+    :param build_windows: function returning the windows of a new plan
+    :return: list of the export IDs triggered by this run
+    """
+    deadline = time.monotonic() + FUNCTION_TIMEOUT - DEADLINE_MARGIN
+    plan = load_state(plan_key)
+    manifest = load_manifest()
+    if plan is None:
+        plan = {"windows": {window_key(w): w for w in build_windows(manifest)}}
+    windows = plan["windows"]
+    for key, window in windows.items():
+        if window["stage"] == WINDOW_FAILED:
+            LOGGER.info(f"Retrying failed window {key}.")
+            window.update(stage=WINDOW_PENDING, attempts=0)
+
+    export_ids = []
+    while True:
+        try:
+            refresh_windows(windows, manifest)
+            export_ids += submit_windows(windows, manifest)
+        finally:
+            save_state(plan_key, plan)
+            save_state(MANIFEST_KEY, manifest)
+        pending = sum(w["stage"] == WINDOW_PENDING for w in windows.values())
+        if not pending:
+            break
+        if time.monotonic() + EXPORT_POLL_INTERVAL > deadline:
+            LOGGER.warning(
+                f"{pending} windows of {plan_key} still pending, trigger the "
+                "same export again to submit them."
+            )
+            break
+        time.sleep(EXPORT_POLL_INTERVAL)
+
+    stages = {}
+    for window in windows.values():
+        stages[window["stage"]] = stages.get(window["stage"], 0) + 1
+    LOGGER.info(f"Export windows of {plan_key} by stage: {stages}.")
+    for window in windows.values():
+        if window["export_id"] in export_ids and (
+            window["estimated_volume"] > HUNDRED_TERABYTES
+        ):
+            raise SystemExit(
+                f"Export with ID: {window['export_id']} might result in more than 100TB of data. This might result in data loss, please check this."
+            )
+    failed = [key for key, w in windows.items() if w["stage"] == WINDOW_FAILED]
+    if failed:
+        raise SystemExit(f"Error during secops export of windows: {failed}")
+    return export_ids
+
+
+def split_log_types(log_types: str):
+    """
+    Split comma separated log types, None standing for all log types.
+    :param log_types: comma separated log types, all logs if empty
+    :return: list of log types
+    """
+    return [t for t in (log_types or "").split(",") if t] or [None]
+
+
+def get_plan_key(name: str, log_types: str):
+    """
+    Build the state key of a plan, so that plans of the same time frame with
+    different log types or window configuration are tracked separately.
+    :param name: name of the plan time frame
+    :param log_types: comma separated log types, all logs if empty
+    :return: name of the plan under the state prefix
+    """
+    config = {
+        "log_types": sorted({t or "ALL" for t in split_log_types(log_types)}),
+        "window_max_bytes": EXPORT_WINDOW_MAX_BYTES,
+    }
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+    return f"plans/{name}_{digest[:12]}.json"
+
+
+def trigger_export(start_date: date, end_date: date, log_types: str):
+    """
+    Plan and trigger the secops exports of a time frame, one window per log
+    type, split in weeks or days when larger than EXPORT_WINDOW_MAX_BYTES.
+    The plan is persisted in the bucket, so that triggering the same time
+    frame again tracks the running windows, re-runs the failed ones and
+    submits the pending ones within the export concurrency quota.
+    :param start_date: first day of the time frame
+    :param end_date: last day of the time frame
+    :param log_types: comma separated log types, all logs are exported if empty
+    :return: list of the export IDs triggered by this run
+    """
+    plan_key = get_plan_key(f"{start_date:%Y-%m-%d}_{end_date:%Y-%m-%d}", log_types)
+    return advance_plan(
+        plan_key,
+        lambda manifest: [
+            new_window(log_type, start_date, end_date)
+            for log_type in split_log_types(log_types)
+        ],
+    )
+
+
+def get_archived_days(manifest: dict, stages: tuple):
+    """
+    Compute the days exported by the manifest exports in some stages.
+    :param manifest: manifest of the archive bucket
+    :param stages: stages of the exports taken into account
+    :return: dictionary of log type (None for all log types) -> set of days
+    """
+    archived = {}
+    for entry in manifest["exports"].values():
+        if entry.get("stage") not in stages or "start" not in entry:
+            continue
+        day = datetime.strptime(entry["start"], "%Y-%m-%d").date()
+        end = datetime.strptime(entry["end"], "%Y-%m-%d").date()
+        days = set()
+        while day <= end:
+            days.add(day)
+            day += timedelta(days=1)
+        for log_type in entry.get("log_types") or [None]:
+            archived.setdefault(log_type, set()).update(days)
+    return archived
+
+
+def find_gaps(manifest: dict, start_date: date, end_date: date, log_types: str):
+    """
+    Compute the windows of days not exported (nor being exported) for each
+    log type, consecutive missing days being merged up to a calendar month.
+    :param manifest: manifest of the archive bucket
+    :param start_date: first day of the time frame
+    :param end_date: last day of the time frame
+    :param log_types: comma separated log types, all logs if empty
+    :return: list of export windows
+    """
+    archived = get_archived_days(
+        manifest, EXPORT_STAGES_RUNNING + ("FINISHED_SUCCESS",)
+    )
+    windows = []
+    for log_type in split_log_types(log_types):
+        covered = archived.get(None, set())
+        if log_type is not None:
+            covered = covered | archived.get(log_type, set())
+        first = None
+        day = start_date
+        while day <= end_date + timedelta(days=1):
+            missing = day <= end_date and day not in covered
+            if first is not None and (not missing or day.day == 1):
+                windows.append(new_window(log_type, first, day - timedelta(days=1)))
+                first = None
+            if missing and first is None:
+                first = day
+            day += timedelta(days=1)
+    return windows
+
+
+def yesterday():
+    """
+    Default last day of backfills: the current day is still being ingested,
+    and exporting it would archive it incomplete once and for all.
+    :return: yesterday's date (format %Y-%m-%d)
+    """
+    return (date.today() - timedelta(days=1)).isoformat()
+
+
+def backfill(start_date: str, end_date: str, log_types: str):
+    """
+    Export the days of a time frame missing from the export history. The
+    history is synced once into the manifest, the missing windows are planned
+    oldest first and submitted by repeated runs within the export concurrency
+    quota, like the windows of a monthly export.
+    :param start_date: first day of the time frame (format %Y-%m-%d)
+    :param end_date: last day of the time frame (format %Y-%m-%d)
+    :param log_types: comma separated log types, all logs are exported if empty
+    :return: list of the export IDs triggered by this run
+    """
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise SystemExit(
+            f"Invalid backfill time frame: {start_date} - {end_date}. Please use YYYY-MM-DD."
+        )
+    if start > end:
+        raise SystemExit(f"Backfill start {start_date} is after end {end_date}.")
+
+    def build_windows(manifest):
+        for export in get_data_exports(list(list_data_exports(None))):
+            record_export(manifest, export)
+        windows = find_gaps(manifest, start, end, log_types)
+        LOGGER.info(f"Found {len(windows)} missing windows to backfill.")
+        return windows
+
+    plan_key = get_plan_key(f"backfill_{start:%Y-%m-%d}_{end:%Y-%m-%d}", log_types)
+    return advance_plan(plan_key, build_windows)
+
+
+def list_data_exports(filters: str):
+    """
+    List the data exports matching a filter, following all the result pages.
+    :param filters: Data Export API list filter
+    :return: generator of data exports
+    """
+    chronicle = get_chronicle()
+    page_token = None
+    while True:
+        response = chronicle.list_data_export(
+            filters=filters, page_size=LIST_PAGE_SIZE, page_token=page_token
+        )
+        yield from response.get("dataExports", [])
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def get_data_exports(exports: list):
+    """
+    Complete listed data exports, fetching the details of an export only if
+    the list payload lacks its status or the log types of a successful export.
+    :param exports: data exports as returned by the list call
+    :return: list of data exports
+    """
+    chronicle = get_chronicle()
+
+    def incomplete(export):
+        status = export.get("dataExportStatus")
+        if not status:
+            return True
+        return status.get("stage") == "FINISHED_SUCCESS" and not (
+            "includeLogTypes" in export or export.get("exportAllLogs")
+        )
+
+    missing = [i for i, export in enumerate(exports) if incomplete(export)]
+    if missing:
+        LOGGER.info(f"Fetching details of {len(missing)} exports.")
+        with futures.ThreadPoolExecutor(max_workers=DETAIL_WORKERS) as pool:
+            details = pool.map(
+                lambda i: chronicle.get_data_export(
+                    data_export_id=exports[i]["name"].split("/")[-1]
+                ),
+                missing,
             )
-            export_id = export_response["name"].split("/")[-1]
-            LOGGER.info(f"Export request response: {export_response}")
-            if (
-                "estimatedVolume" in export_response
-                and int(export_response["estimatedVolume"]) > HUNDRED_TERABYTES
-            ):
+            for i, detail in zip(missing, details):
+                exports[i] = detail
+    return exports
+
+
+def evaluate_exports(manifest: dict, create_time_str: str, log_types: set):
+    """
+    Evaluate the exports of the manifest created after a point in time.
+    :param manifest: manifest of the archive bucket
+    :param create_time_str: creation time of the oldest export to evaluate
+    :param log_types: log types expected in the successful exports
+    :return: log types left, whether exports are running, whether some failed
+    """
+    in_progress_jobs = False
+    failed_jobs = False
+    for export_id, entry in manifest["exports"].items():
+        if entry["created"] < create_time_str:
+            continue
+        stage = entry.get("stage")
+        if stage == "FINISHED_SUCCESS":
+            if entry.get("exported_volume", 0) > HUNDRED_TERABYTES:
                 raise SystemExit(
-                    f"Export with ID: {export_id} might result in more than 100TB of data. This might result in data loss, please check this."
+                    f"Export with ID: {export_id} exported more than 100TB of data. This might result in data loss, please check this."
                 )
-            LOGGER.info(f"Triggered export with ID: {export_id}")
-    except Exception as e:
-        LOGGER.error(f"Error during export': {e}")
-        raise SystemExit(f"Error during secops export: {e}")
-
-    return export_ids
+            if entry.get("log_types") is None:
+                log_types = set()
+            else:
+                log_types = log_types - set(entry["log_types"])
+        elif stage in EXPORT_STAGES_RUNNING:
+            in_progress_jobs = True
+        elif stage in EXPORT_STAGES_FAILED:
+            failed_jobs = True
+        else:
+            raise SystemExit(f"Inconsistent state for export with ID: {export_id}")
+    return log_types, in_progress_jobs, failed_jobs
 
 
 def check_monthly_export(export_month: str, log_types: str):
     """
-    Trigger DLP Job and setup secops feeds to ingest data from output bucket.
-    :param month: month for which data exports should be checked
+    Check that the exports of a month successfully exported the log types.
+    :param export_month: month for which data exports should be checked
+    :param log_types: comma separated log types expected in the exports
     :return:
     """
     try:
@@ -134,56 +640,23 @@ def check_monthly_export(export_month: str, log_types: str):
             f"Invalid export month format: {export_month}. Please use YYYY-MM."
         )
 
-    client = SecOpsClient()
-    chronicle = client.chronicle(
-        customer_id=SECOPS_CUSTOMER_ID,
-        project_id=SECOPS_PROJECT_ID,
-        region=SECOPS_REGION,
-    )
     create_time = datetime(export_month_date.year, export_month_date.month, 1, 0, 0, 0)
     create_time_str = create_time.strftime("%Y-%m-%dT%H:%M:%SZ")
-    data_export_response = chronicle.list_data_export(
-        filters=f'(createTime >= "{create_time_str}")', page_size=1000
-    )
-
-    failed_jobs = False
-    in_progress_jobs = False
     expected_log_types = set(log_types.split(","))
 
-    for export in data_export_response["dataExports"]:
-        data_export = chronicle.get_data_export(
-            data_export_id=export["name"].split("/")[-1]
+    # the manifest answers without API calls once all the exports are final
+    manifest = load_manifest()
+    result = evaluate_exports(manifest, create_time_str, expected_log_types)
+    if result[0]:
+        exports = get_data_exports(
+            list(list_data_exports(f'(createTime >= "{create_time_str}")'))
         )
-        LOGGER.info(f"Export response: {data_export}.")
-        if (
-            "dataExportStatus" in data_export
-            and export["dataExportStatus"]["stage"] == "FINISHED_SUCCESS"
-        ):
-            if (
-                "exportedVolume" in export
-                and int(export["exportedVolume"]) > HUNDRED_TERABYTES
-            ):
-                raise SystemExit(
-                    f"Export with ID: {export['name'].split('/')[-1]} exported more than 100TB of data. This might result in data loss, please check this."
-                )
-            exported_log_types = []
-            for log_type in data_export["includeLogTypes"]:
-                exported_log_types.append(log_type.split("/")[-1])
-            expected_log_types = expected_log_types - set(exported_log_types)
-        elif "dataExportStatus" in data_export and (
-            export["dataExportStatus"]["stage"] == "IN_QUEUE"
-            or export["dataExportStatus"]["stage"] == "PROCESSING"
-        ):
-            in_progress_jobs = True
-        elif (
-            "dataExportStatus" in data_export
-            and export["dataExportStatus"]["stage"] == "FINISHED_FAILURE"
-        ):
-            failed_jobs = True
-        else:
-            raise SystemExit(
-                f"Inconsistent state for export with ID: {export['name'].split('/')[-1]}"
-            )
+        for export in exports:
+            LOGGER.debug(f"Export response: {export}.")
+            record_export(manifest, export)
+        save_state(MANIFEST_KEY, manifest)
+        result = evaluate_exports(manifest, create_time_str, expected_log_types)
+    expected_log_types, in_progress_jobs, failed_jobs = result
 
     if len(expected_log_types) == 0:
         LOGGER.info("Exports finished successfully for all log types in request.")
@@ -191,7 +664,7 @@ def check_monthly_export(export_month: str, log_types: str):
         if in_progress_jobs:
             raise SystemExit("Data Export still in progress")
         elif failed_jobs:
-            raise SystemExit("Data Export still in progress")
+            raise SystemExit("Data Export failed")
         else:
             raise SystemExit(
                 f"Error with checking data export status, no jobs in progress or failures and still {expected_log_types} log types left."
@@ -219,14 +692,7 @@ def trigger_export_action(export_month: str, log_types: str):
     start_date = export_month_date.replace(day=1)
     end_date = start_date + relativedelta(months=1) - timedelta(days=1)
 
-    start_datetime_str = start_date.strftime("%Y-%m-%dT00:00:00Z")
-    end_datetime_str = end_date.strftime("%Y-%m-%dT23:59:59Z")
-
-    return trigger_export(
-        export_start_datetime=start_datetime_str,
-        export_end_datetime=end_datetime_str,
-        log_types=log_types,
-    )
+    return trigger_export(start_date=start_date, end_date=end_date, log_types=log_types)
 
 
 def main(request):
@@ -251,8 +717,14 @@ def main(request):
         case "CHECK-MONTHLY-EXPORT":
             export_month = payload.get("EXPORT_MONTH", date.today().strftime("%Y-%m"))
             check_monthly_export(export_month=export_month, log_types=log_types)
+        case "BACKFILL":
+            backfill(
+                start_date=payload.get("BACKFILL_START_DATE"),
+                end_date=payload.get("BACKFILL_END_DATE") or yesterday(),
+                log_types=log_types,
+            )
         case _:
-            return "Action must be either 'TRIGGER-EXPORT', 'CHECK-MONTHLY-EXPORT'"
+            return "Action must be either 'TRIGGER-EXPORT', 'CHECK-MONTHLY-EXPORT' or 'BACKFILL'"
 
     return "Success."
 
@@ -265,17 +737,38 @@ def main(request):
     type=str,
     help="Month for secops export in YYYY-MM format. If not provided, the previous month will be used.",
 )
+@click.option(
+    "--backfill-start-date",
+    required=False,
+    type=str,
+    help="First day of the backfill in YYYY-MM-DD format.",
+)
+@click.option(
+    "--backfill-end-date",
+    required=False,
+    type=str,
+    help="Last day of the backfill in YYYY-MM-DD format, defaults to yesterday.",
+)
 @click.option("--log-type", type=str, multiple=True)
 @click.option(
     "--action",
-    type=click.Choice(["TRIGGER-EXPORT", "CHECK-MONTHLY-EXPORT"]),
+    type=click.Choice(["TRIGGER-EXPORT", "CHECK-MONTHLY-EXPORT", "BACKFILL"]),
     required=True,
 )
 @click.option("--debug", is_flag=True, default=False, help="Turn on debug logging.")
-def main_cli(export_month, log_type: list, action: str, debug=False):
+def main_cli(
+    export_month,
+    backfill_start_date,
+    backfill_end_date,
+    log_type: list,
+    action: str,
+    debug=False,
+):
     """
     CLI entry point.
     :param export_month: month for secops export
+    :param backfill_start_date: first day of the backfill
+    :param backfill_end_date: last day of the backfill
     :param debug: whether to enable debug logs
     :return:
     """
@@ -291,6 +784,12 @@ def main_cli(export_month, log_type: list, action: str, debug=False):
             check_monthly_export(
                 export_month=export_month, log_types=",".join(log_type)
             )
+        case "BACKFILL":
+            backfill(
+                start_date=backfill_start_date,
+                end_date=backfill_end_date or yesterday(),
+                log_types=",".join(log_type),
+            )
         case _:
             return "Action must be either 'TRIGGER-EXPORT', 'ANONYMIZE-DATA' or 'IMPORT-DATA'"
 
@@ -32,6 +32,19 @@ variable "cloud_function_config" {
   nullable = false
 }
 
+variable "export_config" {
+  description = "Optional export planning configuration: concurrent exports (tenant quota), maximum estimated volume of an export window before splitting it in weeks or days, attempts of each window, export requests per second, seconds between two checks of the running exports."
+  type = object({
+    concurrency      = optional(number, 3)
+    window_max_bytes = optional(number, 10000000000000)
+    max_attempts     = optional(number, 3)
+    rate             = optional(number, 1)
+    poll_interval    = optional(number, 300)
+  })
+  default  = {}
+  nullable = false
+}
+
 variable "prefix" {
   description = "Prefix used for resource names."
   type        = string
@@ -74,6 +87,10 @@ variable "schedule_config" {
     action    = string
     schedule  = string
     log_types = string
+    backfill = optional(object({
+      start_date = string
+      end_date   = optional(string)
+    }))
   }))
   default = {}
 }
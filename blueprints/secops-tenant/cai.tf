@@ -139,11 +139,14 @@ locals {
     for key, value in restful_operation.cai_feeds_secret : key => jsondecode(value.output).secret
   }
   cai_function_config = {
-    NODES                = try([for k, v in var.tenant_nodes.folders : v.folder_id], [])
-    secops_ASSETS_CONFIG = local.secops_assets_config
-    CONTENT_TYPE         = "RESOURCE"
-    PAGE_SIZE            = 1000
-    ORG_ID               = try(var.organization_id, "")
+    NODES                    = try([for k, v in var.tenant_nodes.folders : v.folder_id], [])
+    secops_ASSETS_CONFIG     = local.secops_assets_config
+    CONTENT_TYPE             = "RESOURCE"
+    PAGE_SIZE                = 1000
+    ORG_ID                   = try(var.organization_id, "")
+    INCREMENTAL              = var.secops_ingestion_config.assets_sync_config.incremental
+    DEDUPLICATE              = var.secops_ingestion_config.assets_sync_config.deduplicate
+    FULL_SYNC_INTERVAL_HOURS = var.secops_ingestion_config.assets_sync_config.full_sync_interval_hours
   }
 }
 
@@ -161,6 +164,17 @@ module "cai-to-secops-scheduler-sa" {
   name       = "cai-to-secops-scheduler"
 }
 
+module "cai-to-secops-state" {
+  count      = var.secops_ingestion_config.ingest_assets_data ? 1 : 0
+  source     = "github.com/GoogleCloudPlatform/cloud-foundation-fabric//modules/gcs"
+  project_id = module.project.project_id
+  name       = "${module.project.project_id}-cai-state"
+  location   = var.regions.primary
+  iam = {
+    "roles/storage.objectAdmin" = [module.cai-to-secops[0].service_account_iam_email]
+  }
+}
+
 module "cai-pubsub-topics" {
   source = "github.com/GoogleCloudPlatform/cloud-foundation-fabric//modules/pubsub"
   for_each = var.secops_ingestion_config.ingest_assets_data ? {
@@ -240,6 +254,7 @@ module "cai-to-secops" {
   environment_variables = {
     PIP_DISABLE_PIP_VERSION_CHECK = "True"
     LOG_EXECUTION_ID              = "true"
+    STATE_BUCKET                  = module.cai-to-secops-state[0].name
   }
   iam = {
     "roles/run.invoker" = [
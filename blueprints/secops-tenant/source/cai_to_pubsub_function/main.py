@@ -13,17 +13,87 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import gzip
+import hashlib
 import json
+import random
+import threading
 import time
 import logging
 import google.auth
 import os
-from datetime import datetime, timedelta
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from google.cloud import pubsub_v1
+from google.cloud import storage
 from google.auth.transport.requests import AuthorizedSession
 
 HTTP = AuthorizedSession(google.auth.default()[0])
 LOGGER = logging.getLogger("cai-chronicle")
+# Publisher batching, a batch is sent as soon as one of the limits is reached
+PUBLISH_MAX_MESSAGES = int(os.environ.get("PUBLISH_MAX_MESSAGES", 1000))
+PUBLISH_MAX_BYTES = int(os.environ.get("PUBLISH_MAX_BYTES", 5000000))
+PUBLISH_MAX_LATENCY = float(os.environ.get("PUBLISH_MAX_LATENCY", 0.05))
+# Publisher flow control, publishing blocks while these limits are exceeded
+PUBLISH_MAX_OUTSTANDING_MESSAGES = int(
+    os.environ.get("PUBLISH_MAX_OUTSTANDING_MESSAGES", 5000)
+)
+PUBLISH_MAX_OUTSTANDING_BYTES = int(
+    os.environ.get("PUBLISH_MAX_OUTSTANDING_BYTES", 50000000)
+)
+MAX_REPORTED_ERRORS = 10
+# Number of (label, node) pairs fetched concurrently
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 4))
+# Rate and burst of the CAI requests shared by all the pairs
+FETCH_RATE = float(os.environ.get("FETCH_RATE", 1.5))
+FETCH_BURST = int(os.environ.get("FETCH_BURST", 5))
+# Attempts and maximum backoff (seconds) of throttled or failed page requests
+FETCH_MAX_ATTEMPTS = int(os.environ.get("FETCH_MAX_ATTEMPTS", 6))
+FETCH_MAX_BACKOFF = float(os.environ.get("FETCH_MAX_BACKOFF", 60))
+RETRIABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# Bucket keeping the incremental sync state, incremental sync needs it
+STATE_BUCKET = os.environ.get("STATE_BUCKET")
+WATERMARKS_KEY = "watermarks.json"
+# Content hash index of the assets sent by label, as gzipped JSON
+FINGERPRINTS_KEY = "fingerprints/{label}.json.gz"
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the rate of CAI requests."""
+
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate (float): Tokens added per second, 0 disables limiting.
+            capacity (int): Maximum number of tokens, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+RATE_LIMITER = TokenBucket(FETCH_RATE, FETCH_BURST)
 
 
 def generate_timestamp(offset_days=0):
@@ -38,14 +108,108 @@ def generate_timestamp(offset_days=0):
         str: Timestamp string in ISO 8601 format.
     """
     # Get current UTC time
-    now = datetime.utcnow()
+    now = datetime.now(timezone.utc)
     # Apply offset
     timestamp = now + timedelta(days=offset_days)
     # Format timestamp in ISO 8601 format
-    formatted_time = timestamp.isoformat() + "Z"
+    formatted_time = timestamp.isoformat().replace("+00:00", "Z")
     return formatted_time
 
 
+def parse_timestamp(value):
+    """
+    Parses an RFC3339 UTC timestamp (YYYY-MM-DDTHH:MM:SS[.fraction]Z), as
+    returned by CAI, truncating the fraction to microseconds.
+
+    Args:
+        value (str): The timestamp.
+
+    Returns:
+        datetime: The timezone-aware UTC datetime.
+    """
+    seconds, _, fraction = value.rstrip("Z").partition(".")
+    timestamp = datetime.strptime(seconds, "%Y-%m-%dT%H:%M:%S").replace(
+        tzinfo=timezone.utc
+    )
+    return timestamp + timedelta(microseconds=int(fraction[:6].ljust(6, "0")))
+
+
+def load_state(key):
+    """
+    Loads a JSON state document from the state bucket.
+
+    Args:
+        key (str): The name of the document.
+
+    Returns:
+        dict: The document, None if missing.
+    """
+    blob = storage.Client().bucket(STATE_BUCKET).blob(key)
+    if not blob.exists():
+        return None
+    return json.loads(blob.download_as_text())
+
+
+def save_state(key, state):
+    """
+    Saves a JSON state document to the state bucket.
+
+    Args:
+        key (str): The name of the document.
+        state (dict): The document.
+    """
+    blob = storage.Client().bucket(STATE_BUCKET).blob(key)
+    blob.upload_from_string(json.dumps(state), content_type="application/json")
+
+
+def load_fingerprints(label):
+    """
+    Loads the content hash index of the assets of a label from the state
+    bucket.
+
+    Args:
+        label (str): The Chronicle ingestion label.
+
+    Returns:
+        dict: The index with the time of its last full sync and the hashes by
+        asset name, None if missing.
+    """
+    blob = (
+        storage.Client().bucket(STATE_BUCKET).blob(FINGERPRINTS_KEY.format(label=label))
+    )
+    if not blob.exists():
+        return None
+    return json.loads(gzip.decompress(blob.download_as_bytes()))
+
+
+def save_fingerprints(label, index):
+    """
+    Saves the content hash index of the assets of a label to the state bucket.
+
+    Args:
+        label (str): The Chronicle ingestion label.
+        index (dict): The index.
+    """
+    blob = (
+        storage.Client().bucket(STATE_BUCKET).blob(FINGERPRINTS_KEY.format(label=label))
+    )
+    data = gzip.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+    blob.upload_from_string(data, content_type="application/gzip")
+
+
+def fingerprint(data):
+    """
+    Computes a compact content hash of a serialized asset.
+
+    Args:
+        data (bytes): The serialized asset.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
 def assets_list(
     parent, asset_types, content_type, page_size, read_time, next_page=None
 ):
@@ -84,31 +248,291 @@ def assets_list(
         raise Exception(f"Error fetching assets: {e}")
 
 
-def send_to_pubsub(pubsub_topic_id, asset):
+def retry_delay(response, attempt):
+    """
+    Computes the delay before retrying a failed request, honoring the
+    Retry-After header when present and using exponential backoff with jitter
+    otherwise.
+
+    Args:
+        response: The response of the failed request.
+        attempt (int): The number of the failed attempt, starting from 0.
+
+    Returns:
+        float: The delay in seconds.
     """
-    Publishes a message to a Pub/Sub.
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), FETCH_MAX_BACKOFF)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+            return min(max(delay, 0), FETCH_MAX_BACKOFF)
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(FETCH_MAX_BACKOFF, 2 ** (attempt + 1)))
+
+
+def iter_asset_pages(parent, asset_types, content_type, page_size, read_time):
+    """Yields the assets of Cloud Asset Inventory (CAI) one page at a time.
+
+    Pages are fetched lazily, so that only one page is held in memory and its
+    assets can be published before the next page is requested. Requests go
+    through the shared rate limiter, throttled and failed requests are retried
+    with backoff.
+
+    Args:
+        parent (str): The parent resource name (e.g., projects/your-project-id).
+        asset_types (str): Comma-separated list of asset types to search for.
+        content_type (str): Asset content type (e.g., RESOURCE).
+        page_size (int): The maximum number of assets to return per page.
+        read_time (str): Read time for assets as an RFC3339 timestamp.
+
+    Yields:
+        list: The assets of a page.
+
+    Raises:
+        Exception: An exception if a page cannot be fetched.
+    """
+    next_page = None
+    attempt = 0
+    while True:
+        RATE_LIMITER.acquire()
+        response = assets_list(
+            parent, asset_types, content_type, page_size, read_time, next_page
+        )
+        LOGGER.info(f"response_code: {response.status_code}")
+        if response.status_code in RETRIABLE_STATUS_CODES:
+            attempt += 1
+            if attempt >= FETCH_MAX_ATTEMPTS:
+                raise Exception(
+                    f"Error fetching assets of {parent}: status "
+                    f"{response.status_code} after {attempt} attempts"
+                )
+            delay = retry_delay(response, attempt - 1)
+            LOGGER.info(f"Sleeping for {delay:.1f} seconds.")
+            time.sleep(delay)
+            continue
+        if response.status_code != 200:
+            # fail the sweep, so that its watermark does not move forward
+            raise Exception(
+                f"Error fetching assets of {parent}: status {response.status_code}"
+            )
+        attempt = 0
+        fetched_assets = json.loads(response.text)
+        yield fetched_assets.get("assets", [])
+        next_page = fetched_assets.get("nextPageToken")
+        if not next_page:
+            return
+        LOGGER.info("More pages available.")
+        LOGGER.info(f"nextPageToken: {next_page}")
+
+
+@functools.cache
+def get_publisher_client():
+    """
+    Builds the Pub/Sub publisher client shared by all the topics, batching
+    messages by count, size and latency and blocking publishing while too
+    many messages are waiting to be sent.
+
+    Returns:
+        pubsub_v1.PublisherClient: The publisher client.
+    """
+    return pubsub_v1.PublisherClient(
+        batch_settings=pubsub_v1.types.BatchSettings(
+            max_messages=PUBLISH_MAX_MESSAGES,
+            max_bytes=PUBLISH_MAX_BYTES,
+            max_latency=PUBLISH_MAX_LATENCY,
+        ),
+        publisher_options=pubsub_v1.types.PublisherOptions(
+            flow_control=pubsub_v1.types.PublishFlowControl(
+                message_limit=PUBLISH_MAX_OUTSTANDING_MESSAGES,
+                byte_limit=PUBLISH_MAX_OUTSTANDING_BYTES,
+                limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
+            )
+        ),
+    )
+
+
+class TopicPublisher:
+    """Publishes messages to a topic without blocking on each of them.
+
+    Messages are batched by the shared publisher client, their futures are
+    tracked and their outcome aggregated once they are all done, so that
+    failures are reported once all the messages have been sent instead of
+    stopping at the first one.
+    """
+
+    def __init__(self, topic_id):
+        """
+        Args:
+            topic_id (str): The Pub/Sub topic ID where to publish messages.
+        """
+        self.topic_id = topic_id
+        self.errors = []
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def publish(self, data):
+        """
+        Publishes a message asynchronously.
+
+        Args:
+            data (bytes): The message data.
+
+        Returns:
+            Future: The future of the message ID.
+        """
+        future = get_publisher_client().publish(self.topic_id, data)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def wait(self):
+        """
+        Waits for all the published messages to be sent.
+
+        Outcomes are read from the futures once they are done, rather than
+        counted by done callbacks which may still be running when the waiters
+        are woken up.
+
+        Returns:
+            tuple: The number of published and failed messages.
+        """
+        with self._lock:
+            published = self._futures
+            self._futures = []
+        futures.wait(published)
+        failed = 0
+        for future in published:
+            error = future.exception()
+            if error is None:
+                continue
+            failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append(str(error))
+        return len(published) - failed, failed
+
+
+def get_publisher(publishers, pubsub_topic_id):
+    """
+    Returns the publisher of a topic, creating it on first use.
+
+    Args:
+        publishers (dict): The topic publishers of the current request.
+        pubsub_topic_id (str): The pubsub topic ID.
+
+    Returns:
+        TopicPublisher: The topic publisher.
+    """
+    return publishers.setdefault(pubsub_topic_id, TopicPublisher(pubsub_topic_id))
+
+
+def send_to_pubsub(pubsub_topic_id, asset, publishers):
+    """
+    Publishes an asset to a Pub/Sub topic without waiting for the result.
 
     Args:
         :param asset: The message data to be published.
         :param pubsub_topic_id: The pubsub topic ID where to publish asset
+        :param publishers: The topic publishers of the current request
 
     Returns:
-        str: The message ID of the published message (if successful).
-        Exception: Raises an exception if there's an error publishing.
+        Future: The future of the message ID, failures are aggregated by
+        flush_publishers.
     """
-    publisher = pubsub_v1.PublisherClient()
+    data = json.dumps(asset).encode("utf-8")
+    return get_publisher(publishers, pubsub_topic_id).publish(data)
 
-    try:
-        # Encode message and publish
-        data = json.dumps(asset).encode("utf-8")
-        future = publisher.publish(pubsub_topic_id, data)
-        # Get message ID (success)
-        message_id = future.result()
-        return message_id
-    except Exception as e:
-        # Handle exception (e.g., log error, retry)
-        print(f"Error publishing message to Pub/Sub: {e}")
-        raise  # Re-raise the exception for further handling
+
+def flush_publishers(publishers):
+    """
+    Waits for the messages of all the topics and reports their outcome.
+
+    Args:
+        publishers (dict): The topic publishers of the current request.
+
+    Returns:
+        dict: The number of messages that could not be published by topic.
+    """
+    failed = {}
+    for topic_id, publisher in publishers.items():
+        published, topic_failed = publisher.wait()
+        LOGGER.info(f"Published {published} messages to {topic_id}.")
+        if topic_failed:
+            LOGGER.error(
+                f"Failed to publish {topic_failed} messages to {topic_id}: "
+                f"{publisher.errors}"
+            )
+        failed[topic_id] = topic_failed
+    return failed
+
+
+def sweep_assets(
+    parent,
+    asset_types,
+    content_type,
+    page_size,
+    read_time,
+    pubsub_topic_id,
+    publishers,
+    updated_after=None,
+    fingerprints=None,
+    seen=None,
+):
+    """
+    Sends the assets of a node to Pub/Sub, skipping the assets not updated
+    since the last sync when running incrementally, and the assets identical
+    to the ones previously sent when deduplicating.
+
+    Args:
+        parent (str): The parent resource name (e.g., projects/your-project-id).
+        asset_types (str): Comma-separated list of asset types to search for.
+        content_type (str): Asset content type (e.g., RESOURCE).
+        page_size (int): The maximum number of assets to return per page.
+        read_time (str): Read time for assets as an RFC3339 timestamp.
+        pubsub_topic_id (str): The pubsub topic ID where to publish assets.
+        publishers (dict): The topic publishers of the current request.
+        updated_after (datetime, optional): Only send the assets updated after
+            this time, all the assets are sent if not set.
+        fingerprints (dict, optional): Content hashes of the assets previously
+            sent by name, identical assets are not sent.
+        seen (dict, optional): Receives the content hashes of the assets read,
+            by name.
+
+    Returns:
+        int: The number of assets sent.
+    """
+    publisher = get_publisher(publishers, pubsub_topic_id)
+    sent = 0
+    skipped = 0
+    for assets in iter_asset_pages(
+        parent, asset_types, content_type, page_size, read_time
+    ):
+        for asset in assets:
+            # assets without update time are always sent
+            if (
+                updated_after
+                and "updateTime" in asset
+                and parse_timestamp(asset["updateTime"]) <= updated_after
+            ):
+                skipped += 1
+                continue
+            data = json.dumps(asset).encode("utf-8")
+            if seen is not None:
+                digest = fingerprint(data)
+                seen[asset["name"]] = digest
+                if fingerprints and fingerprints.get(asset["name"]) == digest:
+                    skipped += 1
+                    continue
+            publisher.publish(data)
+            sent += 1
+    if skipped:
+        LOGGER.info(f"{skipped} assets of {parent} unchanged, skipped.")
+    return sent
 
 
 def main(request):
@@ -116,8 +540,12 @@ def main(request):
     handles pagination, and sends retrieved assets to Pub/Sub.
 
     This function retrieves assets from CAI based on provided parameters and a
-    configurable lookback period. It iterates through paginated results,
-    extracts assets, and sends them to Pub/Sub. Error handling is included for
+    configurable lookback period. In incremental mode, only the assets updated
+    since the previous sync of each node and asset type are sent, and when
+    deduplicating the assets identical to the ones previously sent are skipped
+    until the next full sync. Nodes and asset types are swept concurrently,
+    iterating through paginated results and sending the assets of each page to
+    Pub/Sub as soon as the page is fetched. Error handling is included for
     common conditions (success, throttling errors, unexpected exceptions).
 
     Raises:
@@ -139,67 +567,114 @@ def main(request):
         chronicle_assets_config = request_json.get("CHRONICLE_ASSETS_CONFIG")
         content_type = request_json.get("CONTENT_TYPE")
         page_size = request_json.get("PAGE_SIZE")
+        incremental = request_json.get("INCREMENTAL", False)
+        deduplicate = request_json.get("DEDUPLICATE", False)
+        full_sync_interval = timedelta(
+            hours=request_json.get("FULL_SYNC_INTERVAL_HOURS", 24)
+        )
     else:
         LOGGER.error("Did not get configuration parameters from request body.")
         raise SystemExit("No configuration sent from Cloud Scheduler")
 
-    # iterate through all the asset types
-    for chronicle_ingestion_label in chronicle_assets_config.keys():
-        asset_types = chronicle_assets_config[chronicle_ingestion_label]["asset_types"]
-        # iterate through all the GCP nodes for tenant
-        for node in nodes:
-            # List to store GCP CAI Assets
-            assets = []
-            more_results = True
-            try:
-                response = assets_list(
-                    node, asset_types, content_type, page_size, lookback_timestamp
-                )
-                while more_results:
-                    LOGGER.info(f"response_code: {response.status_code}")
-                    if response.status_code == 200:
-                        fetched_assets = json.loads(response.text)
-                        if "assets" in fetched_assets:
-                            for each_asset in fetched_assets["assets"]:  # refactor
-                                assets.append(each_asset)
-                        if "nextPageToken" in fetched_assets:
-                            LOGGER.info("More pages available.")
-                            LOGGER.info(
-                                f"nextPageToken: {fetched_assets['nextPageToken']}"
-                            )
-                            response = assets_list(
-                                node,
-                                asset_types,
-                                content_type,
-                                page_size,
-                                lookback_timestamp,
-                                fetched_assets["nextPageToken"],
-                            )
-                        else:
-                            if assets:
-                                LOGGER.info(
-                                    f"{len(assets)} assets to be sent to PubSub."
-                                )
-                                for asset in assets:
-                                    send_to_pubsub(
-                                        pubsub_topic_id=chronicle_assets_config[
-                                            chronicle_ingestion_label
-                                        ]["pubsub_topic_id"],
-                                        asset=asset,
-                                    )
-                            else:
-                                LOGGER.info("No assets returned from GCP CAI.")
-                            more_results = False
-                    elif response.status_code == 429:
-                        LOGGER.info("Sleeping for 60 seconds.")
-                        time.sleep(60)
-                    else:
-                        LOGGER.info("Catch all for any other HTTP error codes.")
-                        more_results = False
-                        break
+    if (incremental or deduplicate) and not STATE_BUCKET:
+        LOGGER.warning("No state bucket configured, running a full sync.")
+        incremental = deduplicate = False
+    # last read time synced by label and node
+    watermarks = (load_state(WATERMARKS_KEY) or {}) if incremental else {}
+    # content hash indexes by label, None for the labels due a full sync
+    fingerprints = {}
+    seen = {}
+    if deduplicate:
+        labels = list(chronicle_assets_config)
+        with futures.ThreadPoolExecutor() as executor:
+            indexes = executor.map(load_fingerprints, labels)
+        now = datetime.now(timezone.utc)
+        for label, index in zip(labels, indexes):
+            if index and now - parse_timestamp(index["full_sync"]) < full_sync_interval:
+                fingerprints[label] = index
+            else:
+                LOGGER.info(f"Running a full sync of {label} assets.")
+                fingerprints[label] = None
+            seen[label] = {}
+    sync_timestamp = generate_timestamp()
+    synced = set()
+    # publishers track the messages of this request only
+    publishers = {}
 
+    # sweep all the asset types of all the GCP nodes for tenant concurrently
+    errors = 0
+    with futures.ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+        sweeps = {}
+        for chronicle_ingestion_label, config in chronicle_assets_config.items():
+            for node in nodes:
+                watermark = watermarks.get(f"{chronicle_ingestion_label}/{node}")
+                index = fingerprints.get(chronicle_ingestion_label)
+                if deduplicate and index is None:
+                    # full syncs send all the assets
+                    watermark = None
+                sweep = executor.submit(
+                    sweep_assets,
+                    node,
+                    config["asset_types"],
+                    content_type,
+                    page_size,
+                    lookback_timestamp,
+                    config["pubsub_topic_id"],
+                    publishers,
+                    parse_timestamp(watermark) if watermark else None,
+                    index["assets"] if index else None,
+                    seen.get(chronicle_ingestion_label),
+                )
+                sweeps[sweep] = (chronicle_ingestion_label, node)
+        for sweep in futures.as_completed(sweeps):
+            chronicle_ingestion_label, node = sweeps[sweep]
+            try:
+                sent = sweep.result()
             except Exception as e:
-                LOGGER.error(f"Unexpected error: {e}")
-                return f'{"status":"500", "data": "{e}"}'
+                LOGGER.error(
+                    f"Unexpected error for {chronicle_ingestion_label} in {node}: {e}"
+                )
+                errors += 1
+                continue
+            synced.add((chronicle_ingestion_label, node))
+            if sent:
+                LOGGER.info(
+                    f"{sent} {chronicle_ingestion_label} assets of {node} sent to "
+                    "PubSub."
+                )
+            else:
+                LOGGER.info(
+                    f"No {chronicle_ingestion_label} assets of {node} returned from "
+                    "GCP CAI."
+                )
 
+    failed_by_topic = flush_publishers(publishers)
+    failed = sum(failed_by_topic.values())
+    if incremental:
+        # only move forward the pairs whose assets were all published
+        for chronicle_ingestion_label, node in synced:
+            topic_id = chronicle_assets_config[chronicle_ingestion_label][
+                "pubsub_topic_id"
+            ]
+            if not failed_by_topic.get(topic_id):
+                watermarks[f"{chronicle_ingestion_label}/{node}"] = lookback_timestamp
+        save_state(WATERMARKS_KEY, watermarks)
+    if deduplicate:
+        # only update the indexes of the labels whose assets were all published
+        for chronicle_ingestion_label, config in chronicle_assets_config.items():
+            if failed_by_topic.get(config["pubsub_topic_id"]) or any(
+                (chronicle_ingestion_label, node) not in synced for node in nodes
+            ):
+                continue
+            index = fingerprints[chronicle_ingestion_label]
+            if index is None:
+                # full syncs drop the assets not found anymore
+                index = {"full_sync": sync_timestamp, "assets": {}}
+            index["assets"].update(seen[chronicle_ingestion_label])
+            save_fingerprints(chronicle_ingestion_label, index)
+    if errors or failed:
+        return (
+            f'{{"status":"500", "data": "{errors} sweeps failed, '
+            f'{failed} assets not published"}}'
+        )
     return '{"status":"200", "data": "OK"}'
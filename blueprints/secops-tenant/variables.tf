@@ -175,6 +175,11 @@ variable "secops_ingestion_config" {
         override_asset_types = optional(list(string), null)
       }), {})
     }), {})
+    assets_sync_config = optional(object({
+      incremental              = optional(bool, false)
+      deduplicate              = optional(bool, false)
+      full_sync_interval_hours = optional(number, 24)
+    }), {})
   })
   default = {}
   validation {